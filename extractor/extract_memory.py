@@ -1,18 +1,21 @@
+import asyncio
 import json
 import os
-import time
 import re
 from google import genai
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
+OPENAI_MODEL = "gpt-4o-mini"
+GEMINI_MODEL = "gemini-2.0-flash"
+
 def get_openai_client():
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key or api_key.strip() == "" or "your_actual_api_key_here" in api_key or "sk-proj" not in api_key:
         return None
-    return OpenAI(api_key=api_key)
+    return AsyncOpenAI(api_key=api_key)
 
 def get_gemini_key():
     api_key = os.getenv("GEMINI_API_KEY")
@@ -62,8 +65,47 @@ def mock_llm_extraction(chat_history, prompt):
             
     return {"memories": memories}
 
+def _gemini_retry_wait(error):
+    """Seconds to wait before retrying a rate-limited call, or None for other errors."""
+    error_str = str(error)
+    if "429" not in error_str and "RESOURCE_EXHAUSTED" not in error_str:
+        return None
+    
+    # Try to extract wait time
+    wait_time = 10  # Default wait
+    match = re.search(r"retry in (\d+(\.\d+)?)s", error_str)
+    if match:
+        wait_time = float(match.group(1)) + 5 # Add 5s buffer to be safe
+    return wait_time
+
 def extract_with_gemini(chat_history, prompt, api_key):
     """Uses Google Gemini API for extraction with retry logic."""
+    return asyncio.run(aextract_with_gemini(chat_history, prompt, api_key))
+
+def extract_memory_from_chat(chat_path, prompt_path):
+    """
+    Reads chat and prompt files, then attempts extraction via:
+    1. OpenAI (if configured)
+    2. Google Gemini (if configured)
+    3. Mock Fallback
+
+    Runs aextract_memories to completion; must not be called from a running
+    event loop (await aextract_memories there instead).
+    """
+    # Read files
+    try:
+        with open(chat_path, 'r', encoding='utf-8') as f:
+            chat_history = json.load(f)
+        with open(prompt_path, 'r', encoding='utf-8') as f:
+            system_prompt = f.read()
+    except Exception as e:
+        print(f"Error reading files: {e}")
+        return {"memories": []}
+
+    return asyncio.run(aextract_memories(chat_history, system_prompt))
+
+async def aextract_with_gemini(chat_history, prompt, api_key):
+    """Uses Google Gemini API for extraction with retry logic, without blocking the event loop."""
     print("\n[LLM] Attempting to process chat history with Google Gemini...")
     client = genai.Client(api_key=api_key)
     
@@ -73,13 +115,8 @@ def extract_with_gemini(chat_history, prompt, api_key):
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            # Add a small delay before the first attempt if it's not the first run,
-            # to be nice to the rate limiter.
-            if attempt > 0:
-                 pass 
-
-            response = client.models.generate_content(
-                model='gemini-2.0-flash',
+            response = await client.aio.models.generate_content(
+                model=GEMINI_MODEL,
                 contents=full_prompt,
                 config={
                     'response_mime_type': 'application/json'
@@ -87,51 +124,33 @@ def extract_with_gemini(chat_history, prompt, api_key):
             )
             return json.loads(response.text)
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                print(f"[Warning] Gemini Rate Limit hit (Attempt {attempt+1}/{max_retries}).")
-                
-                # Try to extract wait time
-                wait_time = 10  # Default wait
-                match = re.search(r"retry in (\d+(\.\d+)?)s", error_str)
-                if match:
-                    wait_time = float(match.group(1)) + 5 # Add 5s buffer to be safe
-                
-                if attempt < max_retries - 1:
-                    print(f"Waiting {wait_time:.1f}s before retrying...")
-                    time.sleep(wait_time)
-                else:
-                    print("[Error] Max retries exceeded for Gemini.")
-            else:
+            wait_time = _gemini_retry_wait(e)
+            if wait_time is None:
                 print(f"[Warning] Gemini call failed: {e}")
                 break
+            print(f"[Warning] Gemini Rate Limit hit (Attempt {attempt+1}/{max_retries}).")
+            if attempt < max_retries - 1:
+                print(f"Waiting {wait_time:.1f}s before retrying...")
+                await asyncio.sleep(wait_time)
+            else:
+                print("[Error] Max retries exceeded for Gemini.")
     return None
 
-def extract_memory_from_chat(chat_path, prompt_path):
+async def aextract_memories(chat_history, system_prompt):
     """
-    Reads chat and prompt files, then attempts extraction via:
+    Extracts memories from an in-memory chat history via:
     1. OpenAI (if configured)
     2. Google Gemini (if configured)
     3. Mock Fallback
     """
-    # Read files
-    try:
-        with open(chat_path, 'r', encoding='utf-8') as f:
-            chat_history = json.load(f)
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            system_prompt = f.read()
-    except Exception as e:
-        print(f"Error reading files: {e}")
-        return {"memories": []}
-
     # 1. Try OpenAI
     client = get_openai_client()
     if client:
         print("\n[LLM] Attempting to process chat history with OpenAI...")
         try:
             conversation_text = json.dumps(chat_history, indent=2)
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
                 temperature=0,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -143,12 +162,13 @@ def extract_memory_from_chat(chat_path, prompt_path):
         except Exception as e:
             print(f"[Warning] OpenAI call failed: {e}")
             # Don't return yet, try next provider
-            pass
+        finally:
+            await client.close()
 
     # 2. Try Google Gemini (Free Tier available)
     gemini_key = get_gemini_key()
     if gemini_key:
-        result = extract_with_gemini(chat_history, system_prompt, gemini_key)
+        result = await aextract_with_gemini(chat_history, system_prompt, gemini_key)
         if result:
             return result
 
@@ -1,6 +1,8 @@
 import json
 import os
 
+import numpy as np
+
 def deduplicate_memories(memories):
     """
     Simple deduplication based on key.
@@ -18,6 +20,31 @@ def deduplicate_memories(memories):
             
     return list(reversed(unique_memories))
 
+def near_duplicate_rows(embeddings, memory_types, min_similarity):
+    """
+    Semantic deduplication of a batch of memories in one matrix operation.
+    For each row, the index of an earlier kept row of the same type whose
+    cosine similarity is at least ``min_similarity``, or -1 to keep it.
+    """
+    embeddings = np.asarray(embeddings, dtype="float32")
+    if len(embeddings) < 2:
+        return [-1] * len(embeddings)
+
+    norms = np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    unit = embeddings / norms
+    types = np.asarray(memory_types, dtype=object)
+    similar = (unit @ unit.T >= min_similarity) & (types[:, None] == types[None, :])
+
+    duplicate_of = [-1] * len(embeddings)
+    kept = np.zeros(len(embeddings), dtype=bool)
+    for row in range(len(embeddings)):
+        matches = np.flatnonzero(similar[row, :row] & kept[:row])
+        if len(matches):
+            duplicate_of[row] = int(matches[0])
+        else:
+            kept[row] = True
+    return duplicate_of
+
 if __name__ == "__main__":
     # Test
     test_data = [
@@ -0,0 +1,130 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# A batch is encoded as soon as it holds BATCH_SIZE texts, or BATCH_WAIT_MS
+# after its first text arrived, whichever comes first
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+DEFAULT_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching in front of an encoder.
+
+    Texts submitted by concurrent callers are queued and encoded together
+    by one background thread; each caller gets a Future for its own row.
+    The model encodes a batch for little more than the cost of one text,
+    so under load throughput rises for at most ``max_wait_ms`` of added
+    latency.
+
+    Batches are encoded on the batching thread itself, or handed to
+    ``executor`` (e.g. a pool of model worker processes) so that several
+    can be in flight at once.
+    """
+
+    def __init__(self, encode, max_batch_size=None, max_wait_ms=None, executor=None):
+        self.encode = encode
+        self.executor = executor
+        self.max_batch_size = max_batch_size or DEFAULT_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else DEFAULT_BATCH_WAIT_MS) / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, text):
+        """
+        Queue ``text``; the Future resolves to its float32 embedding.
+        """
+        self._start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, texts):
+        """
+        Embed ``texts`` through the shared queue; returns a float32 matrix.
+        """
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    def stop(self):
+        with self._start_lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+
+    def _start(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._encode_batch(batch)
+            if stopping:
+                return
+
+    def _encode_batch(self, batch):
+        texts = [text for text, _ in batch]
+        if self.executor is not None:
+            try:
+                encoded = self.executor.submit(self.encode, texts)
+            except Exception as e:
+                self._fail(batch, e)
+            else:
+                encoded.add_done_callback(lambda encoded: self._resolve(batch, encoded))
+            return
+
+        try:
+            vectors = np.asarray(self.encode(texts), dtype="float32")
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self._deliver(batch, vectors)
+
+    def _resolve(self, batch, encoded):
+        try:
+            vectors = np.asarray(encoded.result(), dtype="float32")
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self._deliver(batch, vectors)
+
+    def _fail(self, batch, error):
+        for _, future in batch:
+            future.set_exception(error)
+
+    def _deliver(self, batch, vectors):
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Embeddings kept in memory (about 1.5 KB each at 384 dimensions)
+DEFAULT_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# SQLite file backing the in-memory tier across restarts ("" to disable)
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings, keyed by a hash of the model name
+    and the text so that changing the model never serves stale vectors.
+
+    Lookups go to an in-memory LRU tier first, then to an optional SQLite
+    file shared by every process using the same ``path``. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, model_name, capacity=None, path=None):
+        self.model_name = model_name
+        self.capacity = capacity if capacity is not None else DEFAULT_CACHE_SIZE
+        self.path = path if path is not None else DEFAULT_CACHE_PATH
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """
+        Cached embedding of each text, or None where it is not cached.
+        """
+        keys = [self.key(text) for text in texts]
+        vectors = [None] * len(keys)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    vectors[i] = vector
+
+            if self._db is not None:
+                missing = {key: i for i, key in enumerate(keys) if vectors[i] is None}
+                for key, blob in self._select(list(missing)):
+                    vector = np.frombuffer(blob, dtype="float32")
+                    vectors[missing[key]] = vector
+                    self._remember(key, vector)
+
+            found = sum(vector is not None for vector in vectors)
+            self.hits += found
+            self.misses += len(vectors) - found
+        return vectors
+
+    def put_many(self, texts, vectors):
+        rows = [
+            (self.key(text), np.asarray(vector, dtype="float32").copy())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            for key, vector in rows:
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in rows]
+                )
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries)
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _select(self, keys):
+        # Stay under SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
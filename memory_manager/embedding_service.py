@@ -1,11 +1,159 @@
-from sentence_transformers import SentenceTransformer
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-# Load model once
-model = SentenceTransformer("all-MiniLM-L6-v2")
+import numpy as np
+
+from memory_manager.embedding_batcher import EmbeddingBatcher, DEFAULT_BATCH_WAIT_MS
+from memory_manager.embedding_cache import EmbeddingCache
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+# "torch" runs the sentence-transformers model; "onnx" runs an exported
+# (by default int8-quantized) copy through ONNX Runtime, without torch
+EMBEDDING_BACKENDS = ("torch", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+    raise ValueError(f"Unknown embedding backend '{EMBEDDING_BACKEND}', expected one of {EMBEDDING_BACKENDS}")
+
+# Worker processes that each hold a warm model and encode batches off this
+# process's GIL (0 encodes in this process)
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", "0"))
+
+# Load the model when the server starts rather than on its first request
+WARM_UP_ON_START = os.getenv("EMBEDDING_WARM_UP", "true").lower() == "true"
+
+# Loaded on first use, so importing the memory manager stays cheap for
+# code that never embeds
+_model = None
+_model_lock = threading.Lock()
+
+# Micro-batcher and worker processes, also created on first use
+batcher = None
+process_pool = None
+_encoders_lock = threading.Lock()
+_encoders_started = False
+
+def _model_id():
+    # Backends produce slightly different vectors, so they are cached apart
+    if EMBEDDING_BACKEND == "onnx":
+        from memory_manager.onnx_backend import DEFAULT_ONNX_QUANTIZE
+        return f"{MODEL_NAME}:onnx-{'int8' if DEFAULT_ONNX_QUANTIZE else 'float32'}"
+    return MODEL_NAME
+
+# Repeated texts (common queries, memories re-written by updates) are
+# embedded once
+cache = EmbeddingCache(_model_id())
+
+def get_model():
+    """
+    The embedding model of the configured backend, loaded once
+    (thread-safe).
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if EMBEDDING_BACKEND == "onnx":
+                    from memory_manager.onnx_backend import OnnxEmbedder
+                    _model = OnnxEmbedder.load(MODEL_NAME)
+                else:
+                    # Deferred: importing torch alone takes seconds
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+def _encode_here(texts):
+    # Also the task run by worker processes, on their own model
+    return np.asarray(get_model().encode(texts), dtype="float32")
+
+def _start_encoders():
+    """
+    Create the worker pool (EMBEDDING_PROCESSES > 0) and the micro-batcher
+    (EMBEDDING_BATCH_WAIT_MS > 0) in front of it or of the local model.
+    """
+    global batcher, process_pool, _encoders_started
+    if _encoders_started:
+        return
+    with _encoders_lock:
+        if _encoders_started:
+            return
+        if EMBEDDING_PROCESSES > 0:
+            # Spawned rather than forked: forking after torch is loaded is unsafe
+            process_pool = ProcessPoolExecutor(
+                max_workers=EMBEDDING_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_model
+            )
+        if DEFAULT_BATCH_WAIT_MS > 0:
+            batcher = EmbeddingBatcher(_encode_here, executor=process_pool)
+        _encoders_started = True
+
+def _encode(texts):
+    _start_encoders()
+    if batcher is not None:
+        return batcher.embed(texts)
+    if process_pool is not None:
+        return process_pool.submit(_encode_here, texts).result()
+    return _encode_here(texts)
+
+def warm_up():
+    """
+    Load the model and run one encode so the first request does not pay
+    for either; with worker processes, start and warm every worker.
+    """
+    _start_encoders()
+    if process_pool is not None:
+        warming = [process_pool.submit(_encode_here, ["warm up"]) for _ in range(EMBEDDING_PROCESSES)]
+        for future in warming:
+            future.result()
+    else:
+        _encode_here(["warm up"])
+
+def shutdown():
+    """
+    Stop the micro-batcher and the worker processes, if started.
+    """
+    if batcher is not None:
+        batcher.stop()
+    if process_pool is not None:
+        process_pool.shutdown()
 
 def generate_embedding(text: str):
     """
     Generate embedding locally using sentence-transformers.
     """
-    embedding = model.encode(text)
-    return embedding.tolist()
+    return generate_embeddings([text])[0].tolist()
+
+def generate_embeddings(texts):
+    """
+    Embed several texts in a single model call.
+    Returns a float32 matrix with one row per text.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, EMBEDDING_DIM), dtype="float32")
+
+    vectors = cache.get_many(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        # Each distinct uncached text is encoded once
+        new_texts = list(dict.fromkeys(texts[i] for i in missing))
+        encoded = _encode(new_texts)
+        cache.put_many(new_texts, encoded)
+        by_text = dict(zip(new_texts, encoded))
+        for i in missing:
+            vectors[i] = by_text[texts[i]]
+    return np.stack(vectors)
+
+def embedding_cache_stats():
+    """
+    Hit/miss counters of the embedding cache, plus the average size of the
+    batches actually encoded.
+    """
+    stats = cache.stats()
+    if batcher is not None and batcher.batches:
+        stats["avg_batch_size"] = round(batcher.items / batcher.batches, 2)
+    return stats
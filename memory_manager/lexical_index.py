@@ -0,0 +1,121 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal-rank fusion constant (Cormack et al.)
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+    a about am an and any are as at be been but by can could did do does for from had has
+    have he her him his how i if in into is it its me my myself no not of on or our
+    please she should so tell than that the their them then there these they this to
+    us was we were what when where which who whom why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lower-cased alphanumeric terms without stopwords; ``dietary_restriction``
+    becomes ``["dietary", "restriction"]``.
+    """
+    return [term for term in TOKEN_PATTERN.findall(str(text).lower()) if term not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over memory keys and values.
+
+    Each term maps to a posting of (memory IDs, term frequencies, document
+    lengths) arrays. Postings are replaced rather than modified, so searches
+    can run without locks while a single writer updates the index.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._doc_terms = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, memory_id, key, value):
+        terms = tokenize(key) + tokenize(value)
+        self._doc_terms[memory_id] = terms
+        self.total_length += len(terms)
+
+        for term, tf in Counter(terms).items():
+            ids, tfs, lengths = self._postings.get(term, _EMPTY_POSTING)
+            self._postings[term] = (
+                np.append(ids, memory_id),
+                np.append(tfs, np.float32(tf)),
+                np.append(lengths, np.float32(len(terms)))
+            )
+
+    def remove(self, memory_id):
+        terms = self._doc_terms.pop(memory_id, None)
+        if terms is None:
+            return
+        self.total_length -= len(terms)
+
+        for term in set(terms):
+            ids, tfs, lengths = self._postings[term]
+            keep = ids != memory_id
+            if keep.any():
+                self._postings[term] = (ids[keep], tfs[keep], lengths[keep])
+            else:
+                del self._postings[term]
+
+    def search(self, text):
+        """
+        (memory_id, bm25 score, coverage) for every memory matching a query
+        term, best first. ``coverage`` is the fraction of the query's terms
+        the memory contains.
+        """
+        terms = set(tokenize(text))
+        n_docs = len(self._doc_terms)
+        if not terms or not n_docs:
+            return []
+        avg_length = max(self.total_length / n_docs, 1.0)
+
+        all_ids, all_scores = [], []
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, lengths = posting
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            all_ids.append(ids)
+            all_scores.append(
+                idf * tfs * (BM25_K1 + 1) / (tfs + BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length))
+            )
+        if not all_ids:
+            return []
+
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        coverage = np.bincount(inverse) / len(terms)
+
+        order = np.lexsort((ids, -scores))
+        return [(int(ids[i]), float(scores[i]), float(coverage[i])) for i in order]
+
+
+_EMPTY_POSTING = (np.empty(0, dtype="int64"), np.empty(0, dtype="float32"), np.empty(0, dtype="float32"))
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse several best-first lists of IDs; returns (id, fused score) pairs,
+    best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
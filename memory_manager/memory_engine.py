@@ -1,6 +1,73 @@
+import asyncio
+import functools
+import os
 import time
-from memory_manager.embedding_service import generate_embedding
-from memory_manager.vector_store import VectorStore
+import weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from memory_manager.deduplicate import near_duplicate_rows
+from memory_manager.embedding_service import generate_embeddings
+from memory_manager.lexical_index import reciprocal_rank_fusion, tokenize
+from memory_manager.reranker import Reranker
+from memory_manager.retention import RetentionPolicy, MemorySweeper
+from memory_manager.retrieval_cache import RetrievalCache
+from memory_manager.serving import (
+    SERVING_MODES, DEFAULT_SERVING_MODE, DEFAULT_SERVING_DIR, LOCK_FILE, INBOX_DIR,
+    WriterLock, WriteInbox, InboxWorker
+)
+from memory_manager.shard_manager import ShardManager, DEFAULT_USER_ID
+
+# A query whose best lexical match contains at least this fraction of its
+# terms is answered from the inverted index alone, skipping the embedding
+# call (values above 1 disable the shortcut)
+LEXICAL_SHORTCUT_COVERAGE = float(os.getenv("LEXICAL_SHORTCUT_COVERAGE", "1.0"))
+
+# New memories at least this cosine-similar to one in the same scope (below),
+# already stored or earlier in the same write, are merged into it instead of
+# being added (values above 1 disable the check)
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.9"))
+# What a near-duplicate must share besides similarity: "key" (same type and
+# key) or "type" (any memory of the same type)
+DUPLICATE_SCOPES = ("key", "type")
+DUPLICATE_SCOPE = os.getenv("DUPLICATE_SCOPE", "key")
+if DUPLICATE_SCOPE not in DUPLICATE_SCOPES:
+    raise ValueError(f"Unknown duplicate scope '{DUPLICATE_SCOPE}', expected one of {DUPLICATE_SCOPES}")
+# Similarity alone is not enough: the texts share their type and key, so a
+# changed age or date can still clear it. The values must also share this
+# fraction of their terms, and every number
+DUPLICATE_TERM_OVERLAP = float(os.getenv("DUPLICATE_TERM_OVERLAP", "0.5"))
+
+# Threads running retrievals and writes for async callers, so embedding and
+# FAISS search (both release the GIL) stay off the event loop
+DEFAULT_WORKER_THREADS = int(os.getenv("MEMORY_WORKER_THREADS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+
+class KeyIndex:
+    """
+    Secondary hash indexes over one shard: key -> memory IDs and
+    (key, value) -> memory IDs.
+    """
+
+    def __init__(self, store):
+        self.by_key = defaultdict(set)
+        self.by_key_value = defaultdict(set)
+
+        for memory_id, metadata in store.iter_metadata():
+            self.add(memory_id, metadata)
+
+    def add(self, memory_id, metadata):
+        self.by_key[metadata["key"]].add(memory_id)
+        self.by_key_value[(metadata["key"], metadata["value"])].add(memory_id)
+
+    def remove(self, memory_id, metadata):
+        for index, index_key in ((self.by_key, metadata["key"]),
+                                 (self.by_key_value, (metadata["key"], metadata["value"]))):
+            memory_ids = index.get(index_key)
+            if memory_ids is None:
+                continue
+            memory_ids.discard(memory_id)
+            if not memory_ids:
+                del index[index_key]
 
 
 class MemoryEngine:
@@ -9,83 +76,480 @@ class MemoryEngine:
     - Structured memory storage
     - Embedding generation
     - Vector indexing using FAISS
-    - Similarity-based retrieval
+    - Similarity-based retrieval, fused with BM25 matches on keys and values
     - Optional filtering by memory type
+    - Per-user namespaces (one index shard per user)
+    - Retention: memories expire by type (TTL) and each user's shard is kept
+      under a capacity cap; expired memories are hidden from searches at
+      once, and a background sweeper removes both incrementally
+    - Multi-process serving (``serving_mode="multi"``): the first process to
+      take the writer lock owns all writes; the others serve retrievals from
+      read-only shards and pass writes to it through an inbox
     """
 
-    def __init__(self):
-        self.store = VectorStore()
+    def __init__(self, shard_dir=None, max_resident_shards=None, index_type=None,
+                 ann_index_type=None, ann_threshold=None, precision=None,
+                 compaction_interval=None, serving_mode=None, serving_dir=None, reranker=None,
+                 retention=None, sweep_interval=None, worker_threads=None, retrieval_cache=None):
+        self.serving_mode = serving_mode or DEFAULT_SERVING_MODE
+        if self.serving_mode not in SERVING_MODES:
+            raise ValueError(f"Unknown serving mode '{self.serving_mode}', expected one of {SERVING_MODES}")
 
-    def _memory_exists(self, key, value):
-        for item in self.store.memory_map:
-            if item["metadata"]["key"] == key and item["metadata"]["value"] == value:
-                return True
-        return False
+        self.is_writer = True
+        self.inbox = None
+        self._writer_lock = None
+        if self.serving_mode == "multi":
+            serving_dir = serving_dir or DEFAULT_SERVING_DIR
+            self._writer_lock = WriterLock(os.path.join(serving_dir, LOCK_FILE))
+            self.is_writer = self._writer_lock.acquire()
+            self.inbox = WriteInbox(os.path.join(serving_dir, INBOX_DIR))
+            print(f"[MemoryEngine] Serving as {'writer' if self.is_writer else 'reader'} (pid {os.getpid()})")
 
-    def _remove_existing_key(self, key):
-        self.store.memory_map = [
-            item for item in self.store.memory_map
-            if item["metadata"]["key"] != key
-        ]
-        self.store.rebuild_index()
+        self.shards = ShardManager(
+            shard_dir=shard_dir,
+            max_resident_shards=max_resident_shards,
+            store_options={
+                "index_type": index_type,
+                "ann_index_type": ann_index_type,
+                "ann_threshold": ann_threshold,
+                "precision": precision
+            },
+            compaction_interval=compaction_interval,
+            read_only=not self.is_writer
+        )
+
+        # Orders vector candidates by similarity, confidence, recency and type
+        self.reranker = reranker or Reranker()
+        # Expiry by memory type and per-user capacity
+        self.retention = retention or RetentionPolicy()
+        # Results of repeated queries, until the user's shard is written to
+        self.retrieval_cache = retrieval_cache or RetrievalCache()
+        self._executor = ThreadPoolExecutor(
+            max_workers=worker_threads or DEFAULT_WORKER_THREADS, thread_name_prefix="memory-engine"
+        )
+
+        self._inbox_worker = None
+        if self.inbox is not None and self.is_writer:
+            self._inbox_worker = InboxWorker(
+                self.inbox, lambda user_id, memory_json: self.store_memories(memory_json, user_id)
+            )
+            self._inbox_worker.start()
+
+        self._sweeper = None
+        if self.is_writer:
+            self._sweeper = MemorySweeper(
+                lambda: [store for _, store in self.shards.resident_shards()],
+                self._evict,
+                self.retention,
+                interval=sweep_interval
+            )
+            self._sweeper.start()
+
+        # Built from the shard on first use, so they always match what was
+        # loaded (snapshot + WAL replay) and disappear when a shard is evicted
+        self._key_indexes = weakref.WeakKeyDictionary()
+
+    def _key_index(self, store):
+        key_index = self._key_indexes.get(store)
+        if key_index is None:
+            key_index = self._key_indexes[store] = KeyIndex(store)
+        return key_index
+
+    def _memory_exists(self, store, key, value):
+        return (key, value) in self._key_index(store).by_key_value
+
+    def _remove_existing_key(self, store, key):
+        key_index = self._key_index(store)
+        memory_ids = list(key_index.by_key.get(key, ()))
+
+        for memory_id in memory_ids:
+            key_index.remove(memory_id, store.get_metadata(memory_id))
+        store.remove_ids(memory_ids)
+
+    def _merge_near_duplicates(self, store, memories, embeddings):
+        """
+        (memory, embedding) pairs still worth adding. A paraphrase of an
+        earlier memory in the batch, or of a stored memory, with the same
+        type and key (any key with DUPLICATE_SCOPE="type") is dropped unless
+        it has higher confidence, in which case it takes that memory's place.
+        Values that change a number or most of their terms are never
+        paraphrases.
+        """
+        if not memories or DUPLICATE_SIMILARITY > 1:
+            return list(zip(memories, embeddings))
+
+        memories, embeddings = list(memories), list(embeddings)
+        if DUPLICATE_SCOPE == "key":
+            groups = [f"{m['type']}\0{m['key']}" for m in memories]
+        else:
+            groups = [m["type"] for m in memories]
+        kept_rows = []
+        duplicate_of = near_duplicate_rows(embeddings, groups, DUPLICATE_SIMILARITY)
+        for row, original in enumerate(duplicate_of):
+            if original == -1 or not _same_fact(memories[row], memories[original]):
+                kept_rows.append(row)
+            elif _confidence(memories[row]) > _confidence(memories[original]):
+                memories[original], embeddings[original] = memories[row], embeddings[row]
+
+        candidate_ids = None
+        if DUPLICATE_SCOPE == "key":
+            by_key = self._key_index(store).by_key
+            candidate_ids = [
+                [
+                    memory_id for memory_id in by_key.get(memories[row]["key"], ())
+                    if store.get_metadata(memory_id)["type"] == memories[row]["type"]
+                ]
+                for row in kept_rows
+            ]
+        existing_ids = store.near_duplicates(
+            [embeddings[row] for row in kept_rows], [memories[row]["type"] for row in kept_rows],
+            DUPLICATE_SIMILARITY, candidate_ids=candidate_ids
+        )
+        merged = []
+        for row, memory_id in zip(kept_rows, existing_ids):
+            metadata = store.get_metadata(memory_id) if memory_id is not None else None
+            if metadata is not None and _same_fact(memories[row], metadata):
+                if _confidence(memories[row]) <= _confidence(metadata):
+                    continue  # Already known
+                self._key_index(store).remove(memory_id, metadata)
+                store.remove_ids([memory_id])
+            merged.append((memories[row], embeddings[row]))
+        return merged
 
-    def store_memories(self, memory_json):
-        updated = False
-        
-        for memory in memory_json.get("memories", []):
+    def _evict(self, store, memory_ids):
+        """
+        Remove memories chosen by the retention policy; returns how many
+        were still live.
+        """
+        with store.lock:
+            key_index = self._key_index(store)
+            removed = []
+            for memory_id in memory_ids:
+                metadata = store.get_metadata(memory_id)
+                if metadata is not None:
+                    key_index.remove(memory_id, metadata)
+                    removed.append(memory_id)
+            if removed:
+                store.remove_ids(removed)
+                store.commit()
+        return len(removed)
+
+    def store_memories(self, memory_json, user_id=DEFAULT_USER_ID):
+        """
+        In a reader process the write is queued for the writer process and
+        becomes visible here once applied there and refreshed.
+        """
+        if not self.is_writer:
+            self.inbox.submit(user_id, memory_json)
+            return
+
+        store = self.shards.get(user_id)
+        memories = memory_json.get("memories", [])
+
+        # The model call runs outside the shard lock, so other writers and
+        # the sweeper are not held up; the write is planned again under the
+        # lock and only applied once every memory it adds has an embedding
+        embeddings = {}
+        while True:
+            with store.lock:
+                cleared_keys, pending = self._plan_write(store, memories)
+                texts = [_embedding_text(memory) for memory in pending]
+                missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+                if not missing:
+                    self._apply_write(store, cleared_keys, pending, [embeddings[text] for text in texts])
+                    return
+
+            # One model call for the whole write
+            embeddings.update(zip(missing, generate_embeddings(missing)))
+
+    def _plan_write(self, store, memories):
+        """
+        Keys cleared by memories with action "update", and the memories
+        still worth adding (not already stored or earlier in the write).
+        """
+        cleared_keys = set()
+        pending = []
+        for memory in memories:
 
             key = memory["key"]
             value = memory["value"]
-            action = memory["action"]
 
-            if action == "update":
-                self._remove_existing_key(key)
-                updated = True
+            if memory["action"] == "update":
+                cleared_keys.add(key)
+                pending = [m for m in pending if m["key"] != key]
 
-            if self._memory_exists(key, value):
+            if (key not in cleared_keys and self._memory_exists(store, key, value)) or any(
+                m["key"] == key and m["value"] == value for m in pending
+            ):
                 continue  # Skip duplicate
 
-            text_representation = f"{memory['type']} | {key} | {value}"
-            embedding = generate_embedding(text_representation)
+            pending.append(memory)
+        return cleared_keys, pending
 
-            self.store.memory_map.append({
-                "metadata": memory,
-                "embedding": embedding
-            })
+    def _apply_write(self, store, cleared_keys, pending, embeddings):
+        # Called with store.lock held
+        for key in cleared_keys:
+            self._remove_existing_key(store, key)
 
-            updated = True
-            
-        if updated:
-            self.store.rebuild_index()
-            self.store.save_index()
+        new_memories = []
+        new_embeddings = []
+        created_at = time.time()
+        for memory, embedding in self._merge_near_duplicates(store, pending, embeddings):
+            memory = dict(memory, created_at=created_at)
+            expires_at = self.retention.expires_at(memory["type"], created_at)
+            if expires_at is not None:
+                memory.setdefault("expires_at", expires_at)
+            new_memories.append(memory)
+            new_embeddings.append(embedding)
 
-    def retrieve_memories(self, query_text, top_k=5, score_threshold=3.0, memory_type=None):
+        if new_memories:
+            # A single insert; the index is updated once
+            memory_ids = store.add_batch(new_memories, new_embeddings)
+            for memory_id, memory in zip(memory_ids, new_memories):
+                self._key_index(store).add(memory_id, memory)
+
+        # Durable via the write-ahead log; snapshots happen in the background
+        if cleared_keys or new_memories:
+            store.commit()
+
+    def retrieve_memories(self, query_text, top_k=5, score_threshold=3.0, memory_type=None,
+                          user_id=DEFAULT_USER_ID, ef_search=None, nprobe=None):
+        """
+        ``ef_search`` and ``nprobe`` tune HNSW and IVF shards respectively;
+        exact (flat) shards ignore them.
+
+        Vector matches are drawn from a larger candidate pool and ordered by
+        the engine's reranker (similarity blended with confidence, recency
+        and memory type), then fused with lexical (BM25) matches by
+        reciprocal rank.
+        Lexical matches carry a ``lexical_score`` and are kept regardless of
+        ``score_threshold``; when they alone are conclusive no embedding is
+        computed and they are returned with a ``score`` of 1.0.
+        Repeated queries are answered from the retrieval cache until the
+        user's shard next changes.
+        """
         start_time = time.time()
+        store = self.shards.get(user_id)
+
+        raw_results = self._cached_search(
+            store,
+            user_id,
+            [{"query_text": query_text, "top_k": top_k, "memory_type": memory_type}],
+            ef_search,
+            nprobe
+        )[0]
 
-        query_embedding = generate_embedding(query_text)
-        raw_results = self.store.search(query_embedding, top_k)
-        
         filtered_results = []
-        
+
         for result in raw_results:
-            if result['score'] > score_threshold:
+            if not _passes_threshold(result, score_threshold):
                 continue
-            
-            if memory_type and result["memory"]["type"] != memory_type:
-                continue
-            
+
             filtered_results.append(result)
 
+        store.touch([result["id"] for result in filtered_results])
+
         latency = time.time() - start_time
         print(f"[MemoryEngine] Retrieval latency: {latency:.4f} seconds")
         print(f"[MemoryEngine] Returned {len(filtered_results)} relevant memories")
-        print(f"[MemoryEngine] Total memories stored: {len(self.store.memory_map)}")
+        print(f"[MemoryEngine] Total memories stored for {user_id}: {len(store)}")
 
         return filtered_results
-    
-    def list_all_memories(self):
+
+    def retrieve_memories_batch(self, queries, user_id=DEFAULT_USER_ID, ef_search=None, nprobe=None):
+        """
+        Retrieve memories for several queries with one embedding call and
+        one matrix search per memory type.
+
+        Each query is a dict with ``query_text`` and optional ``top_k``,
+        ``score_threshold`` and ``memory_type`` (same defaults as
+        ``retrieve_memories``). Returns one result list per query.
+        """
+        start_time = time.time()
+        store = self.shards.get(user_id)
+
+        queries = [dict(query, top_k=query.get("top_k") or 5) for query in queries]
+        thresholds = [query.get("score_threshold", 3.0) for query in queries]
+
+        raw_results = self._cached_search(store, user_id, queries, ef_search, nprobe)
+
+        batch_results = [
+            [result for result in results if _passes_threshold(result, threshold)]
+            for results, threshold in zip(raw_results, thresholds)
+        ]
+        store.touch([result["id"] for results in batch_results for result in results])
+
+        latency = time.time() - start_time
+        print(f"[MemoryEngine] Batch retrieval latency: {latency:.4f} seconds for {len(queries)} queries")
+
+        return batch_results
+
+    def _cached_search(self, store, user_id, queries, ef_search, nprobe):
+        """
+        ``_hybrid_search`` through the retrieval cache: only queries without
+        results from the shard's current version are searched.
+        """
+        # Read before searching: a write that lands during the search changes
+        # the version, so its possibly stale results are never served
+        version = store.write_version
+        keys = [
+            (user_id, query["query_text"], query["top_k"], query.get("memory_type"), ef_search, nprobe)
+            for query in queries
+        ]
+        results = [self.retrieval_cache.get(key, version) for key in keys]
+        # Stale once one of its memories has expired, which changes no version
+        now = time.time()
+        results = [
+            None if cached is not None and any(_expired(result["memory"], now) for result in cached) else cached
+            for cached in results
+        ]
+
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        if missing:
+            searched = self._hybrid_search(store, [queries[i] for i in missing], ef_search, nprobe)
+            for i, query_results in zip(missing, searched):
+                self.retrieval_cache.put(keys[i], version, query_results)
+                results[i] = query_results
+        return results
+
+    def _hybrid_search(self, store, queries, ef_search, nprobe):
+        """
+        Unfiltered results for each query: lexical matches alone when they
+        are conclusive, otherwise vector and lexical matches fused by
+        reciprocal rank. Only the remaining queries are embedded, in one call.
+        """
+        results = [None] * len(queries)
+        lexical_hits = [
+            store.lexical_search(query["query_text"], query["top_k"], query.get("memory_type"))
+            for query in queries
+        ]
+
+        pending = []
+        for i, hits in enumerate(lexical_hits):
+            if hits and hits[0]["coverage"] >= LEXICAL_SHORTCUT_COVERAGE:
+                results[i] = [
+                    {"id": hit["id"], "memory": hit["memory"], "score": 1.0, "lexical_score": hit["lexical_score"]}
+                    for hit in hits
+                ]
+            else:
+                pending.append(i)
+
+        if not pending:
+            return results
+
+        query_embeddings = generate_embeddings(queries[i]["query_text"] for i in pending)
+        vector_results = store.search_batch(
+            query_embeddings,
+            [queries[i]["top_k"] for i in pending],
+            ef_search=ef_search,
+            nprobe=nprobe,
+            memory_types=[queries[i].get("memory_type") for i in pending],
+            reranker=self.reranker
+        )
+        for i, query_embedding, vector_hits in zip(pending, query_embeddings, vector_results):
+            results[i] = _fuse(store, query_embedding, vector_hits, lexical_hits[i], queries[i]["top_k"])
+        return results
+
+    async def aretrieve_memories(self, *args, **kwargs):
+        """
+        Awaitable ``retrieve_memories``, run on the engine's worker threads.
+        """
+        return await self._offload(self.retrieve_memories, *args, **kwargs)
+
+    async def aretrieve_memories_batch(self, *args, **kwargs):
+        """
+        Awaitable ``retrieve_memories_batch``, run on the engine's worker threads.
+        """
+        return await self._offload(self.retrieve_memories_batch, *args, **kwargs)
+
+    async def astore_memories(self, *args, **kwargs):
+        """
+        Awaitable ``store_memories``, run on the engine's worker threads.
         """
-        Return all stored memories (debug / inspection use).
+        return await self._offload(self.store_memories, *args, **kwargs)
+
+    async def _offload(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def list_all_memories(self, user_id=DEFAULT_USER_ID):
+        """
+        Return all stored memories for a user (debug / inspection use).
+        """
+        store = self.shards.get(user_id)
+        return [metadata for _, metadata in store.iter_metadata()]
+
+    def close(self):
+        """
+        Flush all pending writes to snapshots (call on shutdown).
+        """
+        self._executor.shutdown(wait=True)
+        if self._sweeper is not None:
+            self._sweeper.stop()
+        if self._inbox_worker is not None:
+            self._inbox_worker.stop()
+            self.inbox.drain(lambda user_id, memory_json: self.store_memories(memory_json, user_id))
+        self.shards.close()
+        if self._writer_lock is not None:
+            self._writer_lock.release()
+
+    def count_resident_memories(self):
+        """
+        Number of memories across the shards currently loaded in memory.
         """
-        return [item["metadata"] for item in self.store.memory_map]
+        return sum(len(store) for _, store in self.shards.resident_shards())
+
+
+def _embedding_text(memory):
+    return f"{memory['type']} | {memory['key']} | {memory['value']}"
+
+
+def _same_fact(memory, other):
+    """
+    Whether the values of two similar memories can be paraphrases: they
+    share the same numbers and enough of their terms.
+    """
+    terms, other_terms = set(tokenize(memory["value"])), set(tokenize(other["value"]))
+    numbers = {term for term in terms if any(c.isdigit() for c in term)}
+    if numbers != {term for term in other_terms if any(c.isdigit() for c in term)}:
+        return False
+    all_terms = terms | other_terms
+    return not all_terms or len(terms & other_terms) / len(all_terms) >= DUPLICATE_TERM_OVERLAP
+
+
+def _expired(memory, now):
+    expires_at = memory.get("expires_at")
+    return expires_at is not None and expires_at <= now
+
+
+def _confidence(memory):
+    return memory.get("confidence") or 0.0
+
+
+def _passes_threshold(result, score_threshold):
+    # Lexical matches are exact token hits, not subject to the similarity cut
+    return "lexical_score" in result or result['score'] <= score_threshold
+
+
+def _fuse(store, query_embedding, vector_hits, lexical_hits, top_k):
+    """
+    Reciprocal-rank fusion of one query's vector and lexical results.
+    """
+    if not lexical_hits:
+        return vector_hits
+
+    by_id = {hit["id"]: dict(hit) for hit in vector_hits}
+    lexical_only = [hit for hit in lexical_hits if hit["id"] not in by_id]
+    scores = store.similarity(query_embedding, [hit["id"] for hit in lexical_only])
+    for hit, score in zip(lexical_only, scores):
+        if score is not None:
+            by_id[hit["id"]] = {"id": hit["id"], "memory": hit["memory"], "score": score}
+    for hit in lexical_hits:
+        if hit["id"] in by_id:
+            by_id[hit["id"]]["lexical_score"] = hit["lexical_score"]
 
+    fused = reciprocal_rank_fusion([
+        [hit["id"] for hit in vector_hits],
+        [hit["id"] for hit in lexical_hits if hit["id"] in by_id]
+    ])
+    return [by_id[memory_id] for memory_id, _ in fused[:top_k]]
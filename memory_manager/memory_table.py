@@ -0,0 +1,330 @@
+import numpy as np
+
+MISSING = -1
+
+# Metadata fields stored as columns; anything else goes to ``extras``
+COLUMNS = ("type", "key", "value", "confidence", "action", "created_at", "expires_at")
+
+
+class StringPool:
+    """
+    Interns repeated strings (types, keys, actions) as small integer codes.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._codes = {}
+
+    def code(self, string):
+        if string is None:
+            return MISSING
+        code = self._codes.get(string)
+        if code is None:
+            code = self._codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+    def lookup(self, string):
+        """
+        Code of an already interned string, or None.
+        """
+        return self._codes.get(string)
+
+    def string(self, code):
+        return None if code == MISSING else self.strings[code]
+
+
+class MemoryTable:
+    """
+    Columnar (struct-of-arrays) storage for one shard's memories.
+
+    Rows are append-only and ordered by memory ID, so a row is found by
+    binary search on the ``ids`` column. Deleting a row clears its ``live``
+    flag; ``compacted()`` drops dead rows. Embeddings are split between a
+    read-only base matrix (normally the memory-mapped vector file) and an
+    in-RAM tail of rows appended since, which ``rebase()`` folds into a
+    new base once they are persisted.
+
+    One writer may modify the table while readers use it without locks:
+    rows are published by bumping ``n_rows`` after they are filled, the
+    vector segments are swapped as one tuple, and a deleted row keeps its
+    values until compaction.
+    """
+
+    def __init__(self, dim, base_ids=None, base_vectors=None):
+        self.dim = dim
+        n_rows = 0 if base_ids is None else len(base_ids)
+        capacity = max(n_rows, 16)
+
+        self.n_rows = n_rows
+        self.live_count = 0
+        # (base matrix, number of base rows, tail matrix)
+        self._segments = (
+            base_vectors if n_rows else np.empty((0, dim), dtype="float32"),
+            n_rows,
+            np.empty((16, dim), dtype="float32")
+        )
+
+        self.ids = np.empty(capacity, dtype="int64")
+        self.ids[:n_rows] = base_ids if n_rows else []
+        self.live = np.zeros(capacity, dtype=bool)
+        self.type_codes = np.full(capacity, MISSING, dtype="int32")
+        self.key_codes = np.full(capacity, MISSING, dtype="int32")
+        self.action_codes = np.full(capacity, MISSING, dtype="int32")
+        self.confidence = np.full(capacity, np.nan, dtype="float64")
+        self.created_at = np.full(capacity, np.nan, dtype="float64")
+        self.expires_at = np.full(capacity, np.nan, dtype="float64")
+        # Last retrieval time; kept in memory only, not persisted
+        self.last_access = np.full(capacity, np.nan, dtype="float64")
+        self.values = [None] * n_rows
+        self.extras = [None] * n_rows
+
+        self.types = StringPool()
+        self.keys = StringPool()
+        self.actions = StringPool()
+        self._type_counts = {}
+
+    def __len__(self):
+        return self.live_count
+
+    @property
+    def base_vectors(self):
+        return self._segments[0]
+
+    @property
+    def base_rows(self):
+        return self._segments[1]
+
+    def __contains__(self, memory_id):
+        return self.row_of(memory_id) is not None
+
+    def _grow(self, n_rows):
+        capacity = len(self.ids)
+        if n_rows > capacity:
+            capacity = max(n_rows, capacity * 2)
+            for name, fill in (("ids", 0), ("live", False), ("type_codes", MISSING),
+                               ("key_codes", MISSING), ("action_codes", MISSING),
+                               ("confidence", np.nan), ("created_at", np.nan),
+                               ("expires_at", np.nan), ("last_access", np.nan)):
+                column = getattr(self, name)
+                grown = np.full(capacity, fill, dtype=column.dtype)
+                grown[:self.n_rows] = column[:self.n_rows]
+                setattr(self, name, grown)
+
+        base, base_rows, tail = self._segments
+        if n_rows - base_rows > len(tail):
+            grown = np.empty((max(n_rows - base_rows, len(tail) * 2), self.dim), dtype="float32")
+            grown[:self.n_rows - base_rows] = tail[:self.n_rows - base_rows]
+            self._segments = (base, base_rows, grown)
+
+    def row_of(self, memory_id):
+        """
+        Row of a live memory, or None.
+        """
+        row = int(np.searchsorted(self.ids[:self.n_rows], memory_id))
+        if row < self.n_rows and self.ids[row] == memory_id and self.live[row]:
+            return row
+        return None
+
+    def rows_of(self, memory_ids):
+        """
+        Vectorized ``row_of``; rows of IDs that are not live are ``MISSING``.
+        """
+        memory_ids = np.asarray(memory_ids, dtype="int64")
+        if self.n_rows == 0:
+            return np.full(len(memory_ids), MISSING, dtype="int64")
+
+        ids = self.ids[:self.n_rows]
+        rows = np.minimum(np.searchsorted(ids, memory_ids), self.n_rows - 1)
+        found = (ids[rows] == memory_ids) & self.live[rows]
+        return np.where(found, rows, MISSING)
+
+    def append(self, memory_id, metadata, vector):
+        if self.n_rows and memory_id <= self.ids[self.n_rows - 1]:
+            raise ValueError(f"Memory ID {memory_id} is not greater than the last row's ID")
+
+        self._grow(self.n_rows + 1)
+        row = self.n_rows
+        _, base_rows, tail = self._segments
+        self.ids[row] = memory_id
+        tail[row - base_rows] = vector
+        self.values.append(None)
+        self.extras.append(None)
+        self.set_metadata(row, metadata)
+
+        self.n_rows += 1
+        return row
+
+    def set_metadata(self, row, metadata):
+        """
+        Fill the metadata columns of ``row`` and mark it live.
+        """
+        if self.live[row]:
+            self._type_counts[self.type_codes[row]] -= 1
+            self.live[row] = False
+            self.live_count -= 1
+
+        type_code = self.types.code(metadata.get("type"))
+        self.type_codes[row] = type_code
+        self.key_codes[row] = self.keys.code(metadata.get("key"))
+        self.action_codes[row] = self.actions.code(metadata.get("action"))
+        confidence = metadata.get("confidence")
+        self.confidence[row] = np.nan if confidence is None else confidence
+        created_at = metadata.get("created_at")
+        self.created_at[row] = np.nan if created_at is None else created_at
+        expires_at = metadata.get("expires_at")
+        self.expires_at[row] = np.nan if expires_at is None else expires_at
+        self.values[row] = metadata.get("value")
+        extras = {field: value for field, value in metadata.items() if field not in COLUMNS}
+        self.extras[row] = extras or None
+
+        self.live[row] = True
+        self.live_count += 1
+        self._type_counts[type_code] = self._type_counts.get(type_code, 0) + 1
+
+    def restore(self, memory_id, metadata):
+        """
+        Attach metadata to an existing (possibly not yet live) row, as when
+        loading a snapshot whose rows and metadata are stored separately.
+        """
+        row = int(np.searchsorted(self.ids[:self.n_rows], memory_id))
+        if row == self.n_rows or self.ids[row] != memory_id:
+            raise KeyError(memory_id)
+        self.set_metadata(row, metadata)
+
+    def delete(self, memory_id):
+        """
+        Mark a memory dead; returns its row, or None if it was not live.
+        """
+        row = self.row_of(memory_id)
+        if row is None:
+            return None
+
+        self.live[row] = False
+        self.live_count -= 1
+        self._type_counts[self.type_codes[row]] -= 1
+        return row
+
+    def metadata(self, row):
+        """
+        Rebuild the metadata dict stored in ``row``.
+        """
+        metadata = {}
+        for field, value in (("type", self.types.string(self.type_codes[row])),
+                             ("key", self.keys.string(self.key_codes[row])),
+                             ("value", self.values[row])):
+            if value is not None:
+                metadata[field] = value
+        if not np.isnan(self.confidence[row]):
+            metadata["confidence"] = float(self.confidence[row])
+        action = self.actions.string(self.action_codes[row])
+        if action is not None:
+            metadata["action"] = action
+        for field in ("created_at", "expires_at"):
+            value = getattr(self, field)[row]
+            if not np.isnan(value):
+                metadata[field] = float(value)
+        if self.extras[row]:
+            metadata.update(self.extras[row])
+        return metadata
+
+    def memory_type(self, row):
+        return self.types.string(self.type_codes[row])
+
+    def get(self, memory_id):
+        row = self.row_of(memory_id)
+        return None if row is None else self.metadata(row)
+
+    def live_rows(self):
+        return np.flatnonzero(self.live[:self.n_rows])
+
+    def live_ids(self):
+        return self.ids[self.live_rows()]
+
+    def type_count(self, memory_type):
+        code = self.types.lookup(memory_type)
+        return 0 if code is None else self._type_counts.get(code, 0)
+
+    def rows_from(self, memory_id):
+        """
+        Live rows whose ID is ``memory_id`` or greater.
+        """
+        start = int(np.searchsorted(self.ids[:self.n_rows], memory_id))
+        rows = np.arange(start, self.n_rows)
+        return rows[self.live[rows]]
+
+    def filter_type(self, rows, memory_type):
+        code = self.types.lookup(memory_type)
+        if code is None:
+            return rows[:0]
+        return rows[self.type_codes[rows] == code]
+
+    def type_ids(self, memory_type):
+        code = self.types.lookup(memory_type)
+        if code is None:
+            return np.empty(0, dtype="int64")
+        mask = (self.type_codes[:self.n_rows] == code) & self.live[:self.n_rows]
+        return self.ids[:self.n_rows][mask]
+
+    def unexpired(self, rows, now):
+        """
+        Mask of ``rows`` that have not expired by ``now``.
+        """
+        # NaN (never expires) compares False
+        return ~(self.expires_at[rows] <= now)
+
+    def expired_count(self, now, memory_type=None):
+        """
+        Live rows (of ``memory_type``, if given) that have expired by ``now``
+        but not been removed yet.
+        """
+        mask = self.live[:self.n_rows] & (self.expires_at[:self.n_rows] <= now)
+        if memory_type:
+            code = self.types.lookup(memory_type)
+            if code is None:
+                return 0
+            mask &= self.type_codes[:self.n_rows] == code
+        return int(np.count_nonzero(mask))
+
+    def touch(self, memory_ids, now):
+        """
+        Record a retrieval of the live memories among ``memory_ids``.
+        """
+        rows = self.rows_of(memory_ids)
+        self.last_access[rows[rows != MISSING]] = now
+
+    def vectors(self, rows):
+        """
+        Gather the embeddings of ``rows`` into a new float32 matrix.
+        """
+        base, base_rows, tail = self._segments
+        rows = np.asarray(rows, dtype="int64")
+        result = np.empty((len(rows), self.dim), dtype="float32")
+        in_base = rows < base_rows
+        result[in_base] = base[rows[in_base]]
+        result[~in_base] = tail[rows[~in_base] - base_rows]
+        return result
+
+    def tail_vectors(self):
+        _, base_rows, tail = self._segments
+        return tail[:self.n_rows - base_rows]
+
+    def rebase(self, base_vectors):
+        """
+        Use ``base_vectors`` (holding every current row) as the new base and
+        drop the in-RAM tail.
+        """
+        if not self.n_rows:
+            base_vectors = np.empty((0, self.dim), dtype="float32")
+        self._segments = (base_vectors, self.n_rows, np.empty((16, self.dim), dtype="float32"))
+
+    def compacted(self):
+        """
+        Copy of the table holding only live rows, with embeddings in RAM.
+        """
+        rows = self.live_rows()
+        table = MemoryTable(self.dim, self.ids[rows], self.vectors(rows))
+        for new_row, row in enumerate(rows):
+            table.set_metadata(new_row, self.metadata(row))
+        table.last_access[:len(rows)] = self.last_access[rows]
+        return table
@@ -0,0 +1,187 @@
+import json
+import os
+
+import numpy as np
+
+# Exported models are cached here, one directory per model and precision
+DEFAULT_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "memory_manager/onnx")
+# int8 dynamic quantization of the weights (smaller and faster on CPU)
+DEFAULT_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "true").lower() == "true"
+# ONNX Runtime intra-op threads (0 lets ONNX Runtime choose)
+DEFAULT_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+
+# Exports whose embeddings fall below this cosine similarity to the
+# PyTorch model's on the sample texts are rejected
+PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_ONNX_MIN_COSINE", "0.98"))
+PARITY_TEXTS = (
+    "preference | food_preference | vegetarian",
+    "fact | location | Tokyo",
+    "constraint | dietary_restriction | allergic to peanuts",
+    "commitment | scheduled_call | dentist appointment on Friday at 3pm",
+    "Suggest dinner options",
+    "What do you know about me?"
+)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+CONFIG_FILE = "embedder.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def model_dir(model_name, quantize, onnx_dir=None):
+    precision = "int8" if quantize else "float32"
+    return os.path.join(onnx_dir or DEFAULT_ONNX_DIR, f"{model_name.replace('/', '__')}-{precision}")
+
+
+def export_model(model_name, output_dir, quantize=True):
+    """
+    Export a sentence-transformers model's encoder to ONNX (optionally
+    int8-quantized) together with its tokenizer and pooling settings, and
+    check the result against the PyTorch model. Needs torch, onnx and
+    onnxruntime; serving the export needs only onnxruntime and tokenizers.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device="cpu")
+    transformer = reference[0].auto_model.eval()
+    tokenizer = reference.tokenizer
+
+    class Encoder(torch.nn.Module):
+        """Token embeddings only; pooling runs in NumPy."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            )[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    sample = tokenizer(list(PARITY_TEXTS[:2]), padding=True, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(output_dir, MODEL_FILE)
+    torch.onnx.export(
+        Encoder(transformer),
+        tuple(sample[name] for name in input_names),
+        fp32_path,
+        input_names=input_names,
+        output_names=["token_embeddings"],
+        dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+        opset_version=17,
+        external_data=False
+    )
+    if quantize:
+        quantize_dynamic(fp32_path, os.path.join(output_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "quantized": quantize,
+            "max_seq_length": reference.max_seq_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+            "dimension": reference.get_sentence_embedding_dimension()
+        }, f, indent=2)
+
+    exported = OnnxEmbedder(output_dir)
+    parity = parity_check(reference.encode(list(PARITY_TEXTS)), exported.encode(list(PARITY_TEXTS)))
+    print(f"[OnnxEmbedder] Exported {model_name} to {output_dir}: "
+          f"cosine to PyTorch min {parity['min_cosine']:.4f}, mean {parity['mean_cosine']:.4f}")
+    if parity["min_cosine"] < PARITY_MIN_COSINE:
+        # Not marked as exported, so it is never loaded
+        os.remove(os.path.join(output_dir, CONFIG_FILE))
+        raise ValueError(
+            f"ONNX export of {model_name} is too far from the PyTorch model "
+            f"(min cosine {parity['min_cosine']:.4f} < {PARITY_MIN_COSINE})"
+        )
+    return parity
+
+
+def parity_check(reference, candidate):
+    """
+    Row-wise cosine similarity between two embedding matrices of the same
+    texts.
+    """
+    reference = np.asarray(reference, dtype="float32")
+    candidate = np.asarray(candidate, dtype="float32")
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    cosines = (reference * candidate).sum(axis=1) / np.maximum(norms, 1e-12)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+
+class OnnxEmbedder:
+    """
+    Sentence embeddings from an exported model through ONNX Runtime: token
+    embeddings from the ONNX encoder, then mean pooling and L2
+    normalization (the all-MiniLM-L6-v2 pipeline) in NumPy.
+
+    Exposes the subset of the SentenceTransformer interface the embedding
+    service uses.
+    """
+
+    def __init__(self, path, intra_op_threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        threads = intra_op_threads if intra_op_threads is not None else DEFAULT_ONNX_THREADS
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = QUANTIZED_MODEL_FILE if self.config["quantized"] else MODEL_FILE
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    @classmethod
+    def load(cls, model_name, quantize=None, onnx_dir=None, intra_op_threads=None):
+        """
+        Open the cached export of ``model_name``, exporting it first if needed.
+        """
+        quantize = quantize if quantize is not None else DEFAULT_ONNX_QUANTIZE
+        path = model_dir(model_name, quantize, onnx_dir)
+        if not os.path.exists(os.path.join(path, CONFIG_FILE)):
+            export_model(model_name, path, quantize)
+        return cls(path, intra_op_threads)
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def encode(self, texts):
+        single = isinstance(texts, str)
+        encodings = self.tokenizer.encode_batch([texts] if single else list(texts))
+
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype="int64"),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype="int64")
+        }
+        token_embeddings = self.session.run(
+            None, {name: value for name, value in feeds.items() if name in self._input_names}
+        )[0]
+
+        mask = attention_mask[..., None].astype("float32")
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        embeddings = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        embeddings = embeddings.astype("float32")
+        return embeddings[0] if single else embeddings
+
+
+if __name__ == "__main__":
+    # Export (if needed) and report parity: python -m memory_manager.onnx_backend
+    from memory_manager.embedding_service import MODEL_NAME
+    path = model_dir(MODEL_NAME, DEFAULT_ONNX_QUANTIZE)
+    print(export_model(MODEL_NAME, path, DEFAULT_ONNX_QUANTIZE))
@@ -0,0 +1,71 @@
+import os
+import time
+
+import numpy as np
+
+# Size of the nearest-neighbour pool the re-ranker chooses top_k from
+DEFAULT_RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "200"))
+
+# Weights of the blended ranking score. Similarity is 1 / (1 + L2), in
+# (0, 1]; confidence and recency are in [0, 1]; type boosts are added as is.
+DEFAULT_SIMILARITY_WEIGHT = float(os.getenv("RANK_SIMILARITY_WEIGHT", "1.0"))
+DEFAULT_CONFIDENCE_WEIGHT = float(os.getenv("RANK_CONFIDENCE_WEIGHT", "0.1"))
+DEFAULT_RECENCY_WEIGHT = float(os.getenv("RANK_RECENCY_WEIGHT", "0.1"))
+DEFAULT_RECENCY_HALF_LIFE_DAYS = float(os.getenv("RANK_RECENCY_HALF_LIFE_DAYS", "30"))
+DEFAULT_TYPE_BOOSTS = os.getenv("RANK_TYPE_BOOSTS", "constraint=0.1,commitment=0.05")
+
+SECONDS_PER_DAY = 86400.0
+
+
+def parse_type_map(spec):
+    """
+    Parse a per-type setting such as ``"constraint=0.1,commitment=0.05"``
+    into a dict.
+    """
+    values = {}
+    for item in spec.split(","):
+        if item.strip():
+            memory_type, value = item.split("=")
+            values[memory_type.strip()] = float(value)
+    return values
+
+
+class Reranker:
+    """
+    Blends similarity, confidence, recency and type priors into one ranking
+    score, computed over a whole candidate pool in a single NumPy pass.
+
+    Recency halves every ``half_life_days``; memories without a timestamp
+    (written before timestamps were recorded) count as old. A missing
+    confidence counts as 0.
+    """
+
+    def __init__(self, similarity_weight=None, confidence_weight=None, recency_weight=None,
+                 half_life_days=None, type_boosts=None):
+        self.similarity_weight = similarity_weight if similarity_weight is not None else DEFAULT_SIMILARITY_WEIGHT
+        self.confidence_weight = confidence_weight if confidence_weight is not None else DEFAULT_CONFIDENCE_WEIGHT
+        self.recency_weight = recency_weight if recency_weight is not None else DEFAULT_RECENCY_WEIGHT
+        self.half_life_days = half_life_days or DEFAULT_RECENCY_HALF_LIFE_DAYS
+        self.type_boosts = type_boosts if type_boosts is not None else parse_type_map(DEFAULT_TYPE_BOOSTS)
+
+    def type_boost_table(self, type_names):
+        """
+        Boost per interned type code, plus a trailing 0 so that the missing
+        code (-1) indexes to no boost.
+        """
+        return np.array([self.type_boosts.get(name, 0.0) for name in type_names] + [0.0])
+
+    def score(self, similarity, confidence, created_at, type_boost, now=None):
+        """
+        Blended scores for parallel arrays of candidate attributes.
+        """
+        now = time.time() if now is None else now
+        age_days = np.maximum(now - created_at, 0.0) / SECONDS_PER_DAY
+        recency = np.where(np.isnan(created_at), 0.0, 0.5 ** (age_days / self.half_life_days))
+
+        return (
+            self.similarity_weight * similarity
+            + self.confidence_weight * np.nan_to_num(confidence, nan=0.0)
+            + self.recency_weight * recency
+            + type_boost
+        )
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from memory_manager.reranker import parse_type_map, SECONDS_PER_DAY
+
+# Lifetime of memories by type, in days; types not listed never expire
+DEFAULT_TTL_DAYS = os.getenv("MEMORY_TTL_DAYS", "commitment=30")
+
+# Live memories kept per user (0 for no limit); the excess is evicted by
+# EVICTION_POLICY: "lru" (least recently retrieved first) or "confidence"
+# (lowest confidence first, least recently retrieved among equals)
+EVICTION_POLICIES = ("lru", "confidence")
+DEFAULT_MAX_MEMORIES_PER_USER = int(os.getenv("MAX_MEMORIES_PER_USER", "10000"))
+DEFAULT_EVICTION_POLICY = os.getenv("MEMORY_EVICTION_POLICY", "lru")
+
+# The sweeper removes at most SWEEP_BATCH memories per shard every
+# SWEEP_INTERVAL seconds, so a backlog is worked off incrementally
+DEFAULT_SWEEP_INTERVAL = float(os.getenv("MEMORY_SWEEP_INTERVAL", "60"))
+DEFAULT_SWEEP_BATCH = int(os.getenv("MEMORY_SWEEP_BATCH", "256"))
+
+
+class RetentionPolicy:
+    """
+    Decides when memories expire and which ones to evict from a shard that
+    is over capacity.
+    """
+
+    def __init__(self, ttl_days=None, max_memories=None, eviction_policy=None):
+        self.ttl_days = ttl_days if ttl_days is not None else parse_type_map(DEFAULT_TTL_DAYS)
+        self.max_memories = max_memories if max_memories is not None else DEFAULT_MAX_MEMORIES_PER_USER
+        self.eviction_policy = eviction_policy or DEFAULT_EVICTION_POLICY
+        if self.eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"Unknown eviction policy '{self.eviction_policy}', expected one of {EVICTION_POLICIES}"
+            )
+
+    def expires_at(self, memory_type, created_at):
+        """
+        Expiry time of a memory of ``memory_type`` created at ``created_at``,
+        or None if memories of that type do not expire.
+        """
+        ttl_days = self.ttl_days.get(memory_type)
+        if ttl_days is None:
+            return None
+        return created_at + ttl_days * SECONDS_PER_DAY
+
+    def victims(self, table, now=None, limit=None):
+        """
+        IDs of memories to remove from ``table``: expired ones first, then
+        enough of the rest, in eviction order, to get back under capacity.
+        """
+        now = time.time() if now is None else now
+        rows = table.live_rows()
+
+        is_expired = table.expires_at[rows] <= now
+        expired = rows[is_expired]
+        kept = rows[~is_expired]
+
+        victims = expired
+        excess = len(kept) - self.max_memories if self.max_memories > 0 else 0
+        if excess > 0:
+            # Never retrieved since loading counts from the time it was stored
+            last_used = np.nan_to_num(
+                np.fmax(table.last_access[kept], table.created_at[kept]), nan=-np.inf
+            )
+            if self.eviction_policy == "confidence":
+                confidence = np.nan_to_num(table.confidence[kept], nan=-np.inf)
+                order = np.lexsort((kept, last_used, confidence))
+            else:
+                order = np.lexsort((kept, last_used))
+            victims = np.concatenate([expired, kept[order[:excess]]])
+
+        return table.ids[victims[:limit]]
+
+
+class MemorySweeper:
+    """
+    Background thread that removes expired and evicted memories from the
+    resident shards, at most ``batch`` per shard each ``interval`` seconds.
+    Searches already skip expired memories; sweeping reclaims their space.
+    """
+
+    def __init__(self, get_stores, evict, policy, interval=None, batch=None):
+        self.get_stores = get_stores
+        self.evict = evict
+        self.policy = policy
+        self.interval = interval if interval is not None else DEFAULT_SWEEP_INTERVAL
+        self.batch = batch or DEFAULT_SWEEP_BATCH
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="memory-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sweep_all(self):
+        removed = 0
+        for store in self.get_stores():
+            memory_ids = self.policy.victims(store.table, limit=self.batch)
+            if len(memory_ids):
+                removed += self.evict(store, memory_ids.tolist())
+        return removed
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                removed = self.sweep_all()
+                if removed:
+                    print(f"[MemorySweeper] Removed {removed} expired or evicted memories")
+            except Exception as e:
+                print(f"[MemorySweeper] Sweep failed: {e}")
@@ -0,0 +1,59 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Retrieval results kept in memory, across all users (0 disables the cache)
+DEFAULT_RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results.
+
+    Each entry is stamped with the ``write_version`` of the shard it was
+    computed from. A shard's version changes with every add or delete, so an
+    entry from before a write no longer matches and is treated as a miss;
+    nothing has to be invalidated explicitly. Safe to use from several
+    threads.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity if capacity is not None else DEFAULT_RETRIEVAL_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Cached results for ``key`` computed at ``version``, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return [dict(result) for result in entry[1]]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, results):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, [dict(result) for result in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries)
+            }
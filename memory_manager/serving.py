@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# "single": every process opens shards read-write (one server process).
+# "multi": several worker processes share the shard files; the one holding
+# the writer lock owns all writes and the others follow it read-only.
+SERVING_MODES = ("single", "multi")
+DEFAULT_SERVING_MODE = os.getenv("MEMORY_SERVING_MODE", "single")
+DEFAULT_SERVING_DIR = os.getenv("MEMORY_SERVING_DIR", "memory_manager/serving")
+DEFAULT_INBOX_INTERVAL = float(os.getenv("MEMORY_INBOX_INTERVAL", "0.2"))
+
+LOCK_FILE = "writer.lock"
+INBOX_DIR = "inbox"
+
+
+class WriterLock:
+    """
+    Exclusive, non-blocking inter-process lock electing the writer process.
+
+    The lock is released by the OS when the holding process exits, so a
+    restarted worker can take over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """
+        Try to take the lock; returns True if this process is the writer.
+        """
+        if self._file is not None:
+            return True
+
+        if fcntl is None:
+            raise RuntimeError("Multi-process serving requires a POSIX platform")
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a+b")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class WriteInbox:
+    """
+    Spool directory through which reader processes hand writes to the
+    writer process. Each request is one JSON file, published atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def submit(self, user_id, memory_json):
+        os.makedirs(self.path, exist_ok=True)
+        name = f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"user_id": user_id, "memory_json": memory_json}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def drain(self, handler):
+        """
+        Pass every pending request to ``handler(user_id, memory_json)`` in
+        submission order, removing each once it has been handled.
+        """
+        if not os.path.isdir(self.path):
+            return 0
+
+        handled = 0
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    request = json.load(f)
+                handler(request["user_id"], request["memory_json"])
+            except Exception as e:
+                # Set aside so one bad request does not block the rest
+                print(f"[WriteInbox] Request {name} failed: {e}")
+                os.replace(path, path + ".failed")
+                continue
+            os.remove(path)
+            handled += 1
+        return handled
+
+
+class InboxWorker:
+    """
+    Background thread in the writer process that applies inbox requests.
+    """
+
+    def __init__(self, inbox, handler, interval=None):
+        self.inbox = inbox
+        self.handler = handler
+        self.interval = interval if interval is not None else DEFAULT_INBOX_INTERVAL
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="inbox-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.inbox.drain(self.handler)
+            except Exception as e:
+                print(f"[InboxWorker] Applying inbox request failed: {e}")
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from urllib.parse import quote
+
+from memory_manager.vector_store import VectorStore
+from memory_manager.write_ahead_log import WalCompactor
+
+# Not a string, so no client-supplied user ID can reach the default
+# namespace: it is only used when a caller passes no user ID at all.
+DEFAULT_USER_ID = None
+
+# The default namespace keeps using the original single-store location so
+# the existing faiss_index.pkl (every user's memories before sharding) is
+# imported on first load.
+DEFAULT_INDEX_PATH = "memory_manager/faiss_index"
+DEFAULT_SHARD_DIR = os.getenv("MEMORY_SHARD_DIR", "memory_manager/shards")
+DEFAULT_MAX_RESIDENT_SHARDS = int(os.getenv("MAX_RESIDENT_SHARDS", "64"))
+# How stale a read-only shard may get before it catches up with its writer
+DEFAULT_REFRESH_INTERVAL = float(os.getenv("MEMORY_REFRESH_INTERVAL", "0.5"))
+
+
+class ShardManager:
+    """
+    Per-user VectorStore shards with lazy loading and LRU eviction.
+
+    Each user gets an independent index directory under ``shard_dir``. A shard is
+    only read from disk the first time it is requested, and at most
+    ``max_resident_shards`` shards are kept in memory at once; the least
+    recently used one is dropped when the cap is exceeded. Every write is
+    committed to the shard's write-ahead log, so eviction never loses data.
+    An evicted shard that a caller still holds is handed out again rather
+    than loaded a second time, so there is never more than one store (and
+    one log writer) per shard; a background compactor folds the logs of resident shards into snapshots
+    every ``compaction_interval`` seconds.
+
+    With ``read_only=True`` the shards follow a writer in another process
+    instead: a shard is refreshed from the writer's log when it is
+    requested more than ``refresh_interval`` seconds after its last refresh.
+    """
+
+    def __init__(self, shard_dir=None, max_resident_shards=None, dim=384, store_options=None,
+                 compaction_interval=None, read_only=False, refresh_interval=None):
+        self.shard_dir = shard_dir or DEFAULT_SHARD_DIR
+        self.max_resident_shards = max_resident_shards or DEFAULT_MAX_RESIDENT_SHARDS
+        self.dim = dim
+        self.store_options = store_options or {}
+        self.read_only = read_only
+        self.refresh_interval = refresh_interval if refresh_interval is not None else DEFAULT_REFRESH_INTERVAL
+        self._shards = OrderedDict()
+        # Evicted shards, for as long as some caller still holds them
+        self._evicted = weakref.WeakValueDictionary()
+        self._refreshed_at = {}
+        self._lock = threading.Lock()
+
+        self.compactor = WalCompactor(
+            lambda: [store for _, store in self.resident_shards()],
+            interval=compaction_interval
+        )
+        if not read_only:
+            self.compactor.start()
+
+    def shard_path(self, user_id):
+        if user_id is DEFAULT_USER_ID:
+            return DEFAULT_INDEX_PATH
+        if not user_id:
+            raise ValueError("user_id must not be empty")
+        name = quote(user_id, safe='')
+        if name.strip('.') == '':
+            # "." and ".." would resolve to the shard directory or its parent
+            name = name.replace('.', '%2E')
+        return os.path.join(self.shard_dir, name)
+
+    def get(self, user_id=DEFAULT_USER_ID):
+        """
+        Return the shard for ``user_id``, loading it from disk if needed.
+        """
+        with self._lock:
+            store = self._shards.get(user_id)
+            if store is not None:
+                self._shards.move_to_end(user_id)
+                refresh = (
+                    self.read_only
+                    and time.monotonic() - self._refreshed_at[user_id] >= self.refresh_interval
+                )
+                if refresh:
+                    self._refreshed_at[user_id] = time.monotonic()
+            else:
+                refresh = False
+                store = self._evicted.pop(user_id, None)
+                if store is None:
+                    store = VectorStore(
+                        dim=self.dim, index_path=self.shard_path(user_id), read_only=self.read_only,
+                        **self.store_options
+                    )
+                else:
+                    refresh = self.read_only
+                self._shards[user_id] = store
+                self._refreshed_at[user_id] = time.monotonic()
+
+                while len(self._shards) > self.max_resident_shards:
+                    evicted_user_id, evicted = self._shards.popitem(last=False)
+                    self._evicted[evicted_user_id] = evicted
+                    del self._refreshed_at[evicted_user_id]
+                    print(f"[ShardManager] Evicted shard for user {evicted_user_id}")
+
+        # Outside the manager lock, so other users' shards are not held up
+        if refresh:
+            store.refresh()
+        return store
+
+    def evict(self, user_id):
+        with self._lock:
+            self._refreshed_at.pop(user_id, None)
+            store = self._shards.pop(user_id, None)
+            if store is None:
+                return False
+            self._evicted[user_id] = store
+            return True
+
+    def close(self):
+        """
+        Stop the background compactor and snapshot every resident shard.
+        """
+        self.compactor.stop()
+        if not self.read_only:
+            self.compactor.compact_all()
+
+    def resident_shards(self):
+        """
+        Snapshot of currently loaded shards as (user_id, store) pairs.
+        """
+        with self._lock:
+            return list(self._shards.items())
@@ -1,57 +1,1135 @@
 import faiss
+import itertools
+import json
 import numpy as np
 import pickle
 import os
+import threading
+import time
+from collections import defaultdict
+
+from memory_manager.lexical_index import LexicalIndex
+from memory_manager.memory_table import MemoryTable, MISSING
+from memory_manager.reranker import DEFAULT_RERANK_CANDIDATES
+from memory_manager.write_ahead_log import WriteAheadLog, WalTail, encode_vector, decode_vector
+
+# Index selection. "auto" uses exact flat search for small stores and
+# switches to ANN_INDEX_TYPE once a store holds ANN_THRESHOLD vectors.
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivf", "ivfpq")
+DEFAULT_INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+DEFAULT_ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "hnsw")
+DEFAULT_ANN_THRESHOLD = int(os.getenv("ANN_THRESHOLD", "50000"))
+
+# ANN tunables
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+DEFAULT_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+DEFAULT_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_MIN_TRAINING_VECTORS = 4096
+IVFPQ_MIN_TRAINING_VECTORS = 39 * 256
+PQ_SUBVECTOR_DIM = 8
+
+# Precision of the vectors held in the index. Reduced precisions keep the
+# full float32 rows in the memory-mapped vector file and re-rank the
+# top_k * RERANK_FACTOR compressed candidates against them.
+PRECISIONS = ("float32", "float16", "int8", "pq")
+DEFAULT_PRECISION = os.getenv("VECTOR_PRECISION", "float32")
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+PQ_MIN_TRAINING_VECTORS = 39 * 256
+
+# int8 uses a fixed [-1, 1] range per dimension (embeddings are unit
+# normalized) so flat and HNSW indexes need no data to train on
+SQ8_RANGE = 1.0
+
+# Published indexes are never modified: removed IDs are masked until they
+# make up this fraction of the index, at which point a new version is
+# merged (HNSW, which cannot delete at all, is rebuilt instead).
+TOMBSTONE_REBUILD_RATIO = 0.2
+
+# Rows added since the published version are searched exactly until there
+# are this many, then merged into a copy of the index.
+DELTA_MERGE_ROWS = int(os.getenv("DELTA_MERGE_ROWS", "1024"))
+
+# Source of ``VectorStore.write_version`` stamps. Unique across stores, so a
+# reloaded shard never repeats a stamp of the store it replaced.
+_write_versions = itertools.count()
+
+# On-disk layout of a store directory:
+#   vectors.f32     contiguous float32 rows, append-only, opened via mmap
+#   ids.i64         memory ID of each row in vectors.f32
+#   metadata.jsonl  append-only log of {"id", "metadata"} / {"id", "deleted"}
+#   index.faiss     natively serialized FAISS index covering the first
+#                   ``index_rows`` rows
+#   manifest.json   committed sizes of the files above
+#   wal.log         operations since the snapshot above (see write_ahead_log)
+# A compaction writes the data files under a new generation (e.g.
+# vectors.2.f32) and the index under a new index generation; replacing the
+# manifest, which names both, commits the switch, so readers and a
+# restarted writer only ever see one consistent set of files.
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+IDS_FILE = "ids.i64"
+METADATA_FILE = "metadata.jsonl"
+INDEX_FILE = "index.faiss"
+WAL_FILE = "wal.log"
+FORMAT_VERSION = 1
+
+# The serialized FAISS index is only rewritten once this many rows are not
+# covered by it; on load the remaining rows are added from the vector file.
+INDEX_SNAPSHOT_MIN_DELTA = 1000
+INDEX_SNAPSHOT_DELTA_RATIO = 0.1
+
+# Rewrite the files without deleted rows once they make up this fraction
+COMPACTION_MIN_ROWS = 1000
+COMPACTION_DEAD_RATIO = 0.5
+
+
+def _ivf_nlist(n_vectors):
+    return int(min(max(4 * np.sqrt(n_vectors), 16), 65536))
+
+
+def _codec_spec(precision, dim):
+    if precision == "float32":
+        return "Flat"
+    if precision == "float16":
+        return "SQfp16"
+    if precision == "int8":
+        return "SQ8"
+    if precision == "pq":
+        return f"PQ{dim // PQ_SUBVECTOR_DIM}"
+    raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+
+
+def make_index(index_type, dim, n_vectors=0, precision="float32"):
+    """
+    Build an empty ID-mapped FAISS index of the given type and precision.
+
+    ``n_vectors`` sizes the IVF coarse quantizer; IVF and PQ indexes must be
+    trained before vectors are added. IVF indexes store the memory IDs in
+    their inverted lists themselves: an ``IndexIDMap2`` around them goes out
+    of step with the lists after the first ``remove_ids``.
+    """
+    codec = _codec_spec(precision, dim)
+    if index_type == "flat":
+        spec = codec
+    elif index_type == "hnsw":
+        spec = f"HNSW{HNSW_M}" if precision == "float32" else f"HNSW{HNSW_M},{codec}"
+    elif index_type == "ivf":
+        spec = f"IVF{_ivf_nlist(n_vectors)},{codec}"
+    elif index_type == "ivfpq":
+        spec = f"IVF{_ivf_nlist(n_vectors)},PQ{dim // PQ_SUBVECTOR_DIM}"
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    index = faiss.index_factory(dim, spec)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if precision == "int8" and index_type in ("flat", "hnsw"):
+        bounds = np.vstack([-np.ones(dim), np.ones(dim)]) * SQ8_RANGE
+        index.train(bounds.astype("float32"))
+
+    if index_type in ("ivf", "ivfpq"):
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def indexed_ids(index):
+    """
+    Memory IDs held by an index built by ``make_index``.
+    """
+    if not isinstance(index, faiss.IndexIVF):
+        return faiss.vector_to_array(index.id_map)
+    invlists = index.invlists
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+        for list_no in range(invlists.nlist) if invlists.list_size(list_no)
+    ]
+    return np.concatenate(ids) if ids else np.empty(0, dtype="int64")
+
+
+class IndexVersion:
+    """
+    A published FAISS index that readers search without locks.
+
+    The index is never modified once published. It holds every memory with
+    an ID below ``next_id`` except those in ``dead``, the IDs masked since
+    (the only part that still grows).
+    """
+
+    __slots__ = ("number", "index", "kind", "precision", "next_id", "dead")
+
+    def __init__(self, number, index, kind, precision, next_id, dead=None):
+        self.number = number
+        self.index = index
+        self.kind = kind
+        self.precision = precision
+        self.next_id = next_id
+        self.dead = dead if dead is not None else set()
 
 
 class VectorStore:
-    def __init__(self, dim=384, index_path="memory_manager/faiss_index.pkl"):
+    """
+    FAISS-backed store keyed by stable memory IDs.
+
+    The index is keyed by memory ID (natively for IVF, through an
+    ``IndexIDMap2`` otherwise) so vectors can be inserted and removed
+    individually (``add_with_ids`` / ``remove_ids``) without rebuilding the
+    whole index on every write.
+
+    The index type is pluggable (flat, HNSW, IVF, IVF-PQ). With
+    ``index_type="auto"`` the store starts with exact flat search and is
+    rebuilt once as ``ann_index_type`` when it grows past ``ann_threshold``.
+
+    ``precision`` compresses the vectors held in the index (float16,
+    scalar-quantized int8 or product quantization). Searches then re-rank
+    an enlarged candidate set against the exact float32 vectors.
+
+    Searches never wait on writes. They run against the current
+    ``IndexVersion``, which writers replace rather than modify: rows added
+    since it was published are searched exactly from the table, deletions
+    are masked, and every ``DELTA_MERGE_ROWS`` rows a copy of the index is
+    brought up to date and published in a single reference swap.
+
+    Memories live in a columnar ``MemoryTable`` whose rows line up with
+    the rows of the vector file. ``index_path`` is a directory holding that
+    memory-mapped float32 vector file, a JSON-lines metadata sidecar and
+    the serialized FAISS index. Saves only append what changed since the
+    previous save. A legacy ``<index_path>.pkl`` file is imported on first
+    load.
+
+    Writes are made durable with ``commit()``, which appends them to a
+    write-ahead log; ``save_index()`` folds the log into the snapshot files
+    and is meant to run in the background. Hold ``lock`` around a batch of
+    writes so a concurrent snapshot sees it whole.
+
+    With ``read_only=True`` the store follows a directory owned by a writer
+    in another process: it maps the same vector file, never writes, and
+    ``refresh()`` applies the writer's newly logged operations.
+    """
+
+    def __init__(self, dim=384, index_path="memory_manager/faiss_index",
+                 index_type=None, ann_index_type=None, ann_threshold=None, precision=None,
+                 read_only=False):
         self.dim = dim
         self.index_path = index_path
-        self.index = faiss.IndexFlatL2(dim)
-        self.memory_map = []
+        self.index_type = index_type or DEFAULT_INDEX_TYPE
+        self.ann_index_type = ann_index_type or DEFAULT_ANN_INDEX_TYPE
+        self.ann_threshold = ann_threshold if ann_threshold is not None else DEFAULT_ANN_THRESHOLD
+        self.precision = precision or DEFAULT_PRECISION
+
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{self.index_type}', expected one of {INDEX_TYPES}")
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{self.precision}', expected one of {PRECISIONS}")
+
+        index_kind = self._resolve_index_kind(0)
+        index_precision = self._resolve_precision(0)
+        self.version = IndexVersion(
+            0, make_index(index_kind, dim, precision=index_precision), index_kind, index_precision, 0
+        )
+        self.table = MemoryTable(dim)
+        self.lexical = LexicalIndex()
+        self.next_id = 0
+        # Changes after every add or delete (applied from the log or not),
+        # once its effects are visible to searches
+        self.write_version = next(_write_versions)
+
+        # memory type -> FAISS selector over its live IDs, used to restrict
+        # searches by type; writes are counted per type (None counts resets
+        # of every type) so a selector built during a write is not cached
+        self._type_selectors = {}
+        self._type_writes = defaultdict(int)
+        self._selector_lock = threading.Lock()
 
-        if os.path.exists(index_path):
+        # Persistence bookkeeping. Table rows below ``table.base_rows`` are
+        # on disk; deletions of those rows are pending until the next save.
+        self._metadata_size = 0
+        self._index_rows = 0
+        self._index_dirty = True
+        self._pending_deletes = []
+        self._generation = 0
+        self._index_generation = 0
+        # Files of earlier generations, removed once the manifest moves on
+        self._superseded = []
+
+        self.lock = threading.RLock()
+        self.wal = WriteAheadLog(self._path(WAL_FILE))
+        self._wal_buffer = []
+
+        # Replication state: the last log sequence number applied and the
+        # one the loaded snapshot covers. Read-only stores tail the log.
+        self.read_only = read_only
+        self._applied_lsn = 0
+        self._snapshot_lsn = 0
+        self._wal_tail = None
+
+        if any(os.path.exists(path) for path in
+               (self._path(MANIFEST_FILE), self._path(WAL_FILE), self.legacy_path)):
             self.load_index()
 
+    @property
+    def index(self):
+        return self.version.index
+
+    @property
+    def index_kind(self):
+        return self.version.kind
+
+    @property
+    def index_precision(self):
+        return self.version.precision
+
+    @property
+    def legacy_path(self):
+        return f"{self.index_path}.pkl"
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, memory_id):
+        return memory_id in self.table
+
+    def get_metadata(self, memory_id):
+        """
+        Metadata of a live memory, or None.
+        """
+        return self.table.get(memory_id)
+
+    def touch(self, memory_ids):
+        """
+        Record that ``memory_ids`` were just retrieved (in memory only; used
+        for least-recently-used eviction). Allowed on read-only stores.
+        """
+        self.table.touch(memory_ids, time.time())
+
+    def iter_metadata(self):
+        """
+        Yield (memory_id, metadata) for every live memory in ID order.
+        """
+        table = self.table
+        for row in table.live_rows():
+            yield int(table.ids[row]), table.metadata(row)
+
+    def _data_path(self, filename):
+        return self._path(_generation_file(filename, self._generation))
+
+    def _index_file_path(self):
+        return self._path(_generation_file(INDEX_FILE, self._index_generation))
+
+    def _path(self, filename):
+        return os.path.join(self.index_path, filename)
+
+    def _resolve_index_kind(self, n_vectors):
+        index_type = self.index_type
+        if index_type == "auto":
+            if n_vectors < self.ann_threshold:
+                return "flat"
+            index_type = self.ann_index_type
+
+        # IVF variants need enough vectors to train their quantizers
+        if index_type == "ivf" and n_vectors < IVF_MIN_TRAINING_VECTORS:
+            return "flat"
+        if index_type == "ivfpq" and n_vectors < IVFPQ_MIN_TRAINING_VECTORS:
+            return "flat"
+        return index_type
+
+    def _resolve_precision(self, n_vectors):
+        # PQ codebooks need enough vectors to train; use float16 until then
+        if self.precision == "pq" and n_vectors < PQ_MIN_TRAINING_VECTORS:
+            return "float16"
+        return self.precision
+
+    def _needs_upgrade(self):
+        n_vectors = len(self.table)
+        if self.index_kind == "flat" and self._resolve_index_kind(n_vectors) != "flat":
+            return True
+        return self.index_precision != self.precision and self._resolve_precision(n_vectors) == self.precision
+
+    def add(self, metadata, embedding):
+        """
+        Insert a single memory and return its memory ID.
+        """
+        return self.add_batch([metadata], [embedding])[0]
+
+    def add_batch(self, metadatas, embeddings):
+        """
+        Insert several memories and return their memory IDs. The index is
+        brought up to date once for the whole batch.
+        """
+        self._check_writable()
+        vectors_np = np.asarray(embeddings, dtype="float32").reshape(-1, self.dim)
+
+        with self.lock:
+            memory_ids = list(range(self.next_id, self.next_id + len(vectors_np)))
+            for memory_id, metadata, vector_np in zip(memory_ids, metadatas, vectors_np):
+                self._append_row(memory_id, metadata, vector_np)
+                self._wal_buffer.append({
+                    "op": "add",
+                    "id": memory_id,
+                    "metadata": metadata,
+                    "embedding": encode_vector(vector_np)
+                })
+            if memory_ids:
+                self._index_new_rows()
+        return memory_ids
+
+    def _insert(self, memory_id, metadata, vector_np):
+        self._append_row(memory_id, metadata, vector_np[0])
+        self._index_new_rows()
+
+    def _append_row(self, memory_id, metadata, vector):
+        self.next_id = max(self.next_id, memory_id + 1)
+        self.table.append(memory_id, metadata, vector)
+        self.lexical.add(memory_id, metadata.get("key"), metadata.get("value"))
+        self._invalidate_selectors(metadata.get("type"))
+        self.write_version = next(_write_versions)
+
+    def _index_new_rows(self):
+        if self._needs_upgrade():
+            # One-off switch to an ANN or trained index; includes the new vector
+            self.rebuild_index()
+        elif self._delta_rows() >= DELTA_MERGE_ROWS:
+            self._merge()
+
+    def _delta_rows(self):
+        """
+        Number of table rows added since the published version.
+        """
+        start = np.searchsorted(self.table.ids[:self.table.n_rows], self.version.next_id)
+        return self.table.n_rows - int(start)
+
+    def remove_ids(self, memory_ids):
+        """
+        Remove memories by ID. Unknown IDs are ignored.
+        """
+        self._check_writable()
+        with self.lock:
+            memory_ids = [memory_id for memory_id in memory_ids if memory_id in self.table]
+            if not memory_ids:
+                return 0
+
+            self._wal_buffer.append({"op": "delete", "ids": memory_ids})
+            return self._delete(memory_ids)
+
+    def _delete(self, memory_ids):
+        memory_ids = [memory_id for memory_id in memory_ids if memory_id in self.table]
+        if not memory_ids:
+            return 0
+
+        version = self.version
+        for memory_id in memory_ids:
+            row = self.table.delete(memory_id)
+            self.lexical.remove(memory_id)
+            self._invalidate_selectors(self.table.memory_type(row))
+            # Rows not yet on disk are saved without metadata, i.e. as dead
+            if row < self.table.base_rows:
+                self._pending_deletes.append(memory_id)
+            if memory_id < version.next_id:
+                version.dead.add(memory_id)
+        self.write_version = next(_write_versions)
+
+        if len(version.dead) > TOMBSTONE_REBUILD_RATIO * version.index.ntotal:
+            self._merge()
+        return len(memory_ids)
+
+    def _merge(self):
+        """
+        Publish a copy of the index with the rows added since the current
+        version and, where the index type allows it, without masked IDs.
+        """
+        version = self.version
+        if version.kind == "hnsw" and len(version.dead) > TOMBSTONE_REBUILD_RATIO * version.index.ntotal:
+            self.rebuild_index()
+            return
+
+        index = faiss.clone_index(version.index)
+        dead = set()
+        if version.dead:
+            if version.kind == "hnsw":
+                dead = set(version.dead)
+            else:
+                index.remove_ids(np.fromiter(version.dead, dtype="int64", count=len(version.dead)))
+
+        rows = self.table.rows_from(version.next_id)
+        if len(rows):
+            index.add_with_ids(self.table.vectors(rows), self.table.ids[rows])
+        self._publish(index, version.kind, version.precision, dead)
+
+    def _publish(self, index, index_kind, index_precision, dead=None):
+        self.version = IndexVersion(
+            self.version.number + 1, index, index_kind, index_precision, self.next_id, dead
+        )
+
+    def _type_selector(self, memory_type):
+        """
+        FAISS ID selector over the live memories of ``memory_type``, cached
+        until that type is next written.
+
+        A missing selector is built without waiting on writers and only
+        cached if no write of that type started in the meantime.
+        """
+        selector = self._type_selectors.get(memory_type)
+        if selector is None:
+            writes = (self._type_writes[None], self._type_writes[memory_type])
+            selector = faiss.IDSelectorBatch(self.table.type_ids(memory_type))
+            with self._selector_lock:
+                if writes == (self._type_writes[None], self._type_writes[memory_type]):
+                    self._type_selectors[memory_type] = selector
+        return selector
+
+    def _invalidate_selectors(self, memory_type=None):
+        """
+        Drop the cached selector of ``memory_type`` (of every type if None)
+        once the table has been changed.
+        """
+        with self._selector_lock:
+            self._type_writes[memory_type] += 1
+            if memory_type is None:
+                self._type_selectors = {}
+            else:
+                self._type_selectors.pop(memory_type, None)
+
     def rebuild_index(self):
-        self.index = faiss.IndexFlatL2(self.dim)
+        n_vectors = len(self.table)
+        index_kind = self._resolve_index_kind(n_vectors)
+        index_precision = self._resolve_precision(n_vectors)
+        index = make_index(index_kind, self.dim, n_vectors, precision=index_precision)
+        self._index_dirty = True
 
-        vectors = []
-        for memory in self.memory_map:
-            vectors.append(memory["embedding"])
+        if n_vectors:
+            rows = self.table.live_rows()
+            vectors_np = self.table.vectors(rows)
+            if not index.is_trained:
+                index.train(vectors_np)
+            index.add_with_ids(vectors_np, self.table.ids[rows])
+        self._publish(index, index_kind, index_precision)
 
-        if vectors:
-            vectors_np = np.array(vectors).astype("float32")
-            self.index.add(vectors_np)
+    def _search_params(self, index_kind, ef_search=None, nprobe=None, selector=None):
+        if index_kind == "hnsw":
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = ef_search or DEFAULT_EF_SEARCH
+        elif index_kind in ("ivf", "ivfpq"):
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe or DEFAULT_NPROBE
+        elif selector is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
 
-    def search(self, embedding, top_k=5):
-        if self.index.ntotal == 0:
-            return []
+        if selector is not None:
+            params.sel = selector
+        return params
+
+    def search(self, embedding, top_k=5, ef_search=None, nprobe=None, memory_type=None, reranker=None):
+        """
+        Return up to ``top_k`` nearest memories.
+
+        ``ef_search`` (HNSW) and ``nprobe`` (IVF) trade recall for speed and
+        are ignored by index types that do not use them. ``memory_type``
+        restricts the search itself to memories of that type, so the result
+        is not starved by closer memories of other types.
+
+        With a ``reranker``, the ``rerank_candidates`` nearest memories are
+        ordered by its blended score instead of by distance, and each
+        result carries that ``rank_score``.
+        """
+        return self.search_batch(
+            [embedding], top_k, ef_search=ef_search, nprobe=nprobe, memory_types=[memory_type],
+            reranker=reranker
+        )[0]
+
+    def search_batch(self, embeddings, top_k=5, ef_search=None, nprobe=None, memory_types=None,
+                     reranker=None, rerank_candidates=None):
+        """
+        Search several query vectors at once; returns one result list per row.
 
-        vector_np = np.array([embedding]).astype("float32")
-        distances, indices = self.index.search(vector_np, top_k)
+        ``top_k`` may be a single value or one per query, and ``memory_types``
+        one type (or None) per query. Queries sharing a type are answered by
+        a single matrix search. ``reranker`` is as for ``search``. Expired
+        memories are left out even before the sweeper removes them.
+        """
+        vectors_np = np.asarray(embeddings, dtype="float32").reshape(-1, self.dim)
+        n_queries = len(vectors_np)
+        top_ks = [top_k] * n_queries if isinstance(top_k, int) else list(top_k)
+        memory_types = memory_types or [None] * n_queries
+
+        # One version and one table for the whole call, whatever writers
+        # publish or compact meanwhile
+        version = self.version
+        table = self.table
+        now = time.time()
+
+        results = [[] for _ in range(n_queries)]
+        if len(table) == 0:
+            return results
+
+        groups = defaultdict(list)
+        for row, memory_type in enumerate(memory_types):
+            groups[memory_type].append(row)
+
+        for memory_type, rows in groups.items():
+            group_k = max(top_ks[row] for row in rows)
+            if reranker is not None:
+                group_k = max(group_k, rerank_candidates or DEFAULT_RERANK_CANDIDATES)
+            group_candidates = self._search_group(
+                version, table, vectors_np[rows], group_k, ef_search, nprobe, memory_type, now
+            )
+            if reranker is not None:
+                # Every candidate's type is interned by now
+                type_boosts = reranker.type_boost_table(table.types.strings)
+            for row, candidates in zip(rows, group_candidates):
+                if reranker is not None:
+                    results[row] = self._blend(table, candidates, reranker, type_boosts, top_ks[row])
+                    continue
+                results[row] = [
+                    {
+                        "id": int(table.ids[table_row]),
+                        "memory": table.metadata(table_row),
+                        "score": float(1 / ( 1 + distance))
+                    }
+                    for distance, table_row in candidates[:top_ks[row]]
+                ]
+        return results
 
+    def lexical_search(self, text, top_k=5, memory_type=None):
+        """
+        Up to ``top_k`` BM25 matches of ``text`` against memory keys and
+        values, best first. Each result carries its ``lexical_score`` and
+        the ``coverage`` of the query's terms.
+        """
+        table = self.table
+        now = time.time()
         results = []
-        for distance, idx in zip(distances[0], indices[0]):
-            if idx == -1:
+        for memory_id, lexical_score, coverage in self.lexical.search(text):
+            row = table.row_of(memory_id)
+            if row is None or (memory_type and table.memory_type(row) != memory_type):
                 continue
-            
-            if idx >= len(self.memory_map):
+            if table.expires_at[row] <= now:
                 continue
-            
             results.append({
-                "memory": self.memory_map[idx]["metadata"],
-                "score": float(1 / ( 1 + distance))
+                "id": memory_id,
+                "memory": table.metadata(row),
+                "lexical_score": lexical_score,
+                "coverage": coverage
             })
+            if len(results) == top_k:
+                break
         return results
 
+    def near_duplicates(self, embeddings, memory_types, min_similarity, candidate_ids=None):
+        """
+        For each embedding, the ID of its nearest live memory of the same
+        type if their cosine similarity is at least ``min_similarity``,
+        otherwise None. One nearest-neighbour lookup per embedding.
+
+        With ``candidate_ids`` (a list of memory IDs per embedding) only
+        those memories are compared instead, exactly.
+        """
+        vectors_np = np.asarray(embeddings, dtype="float32").reshape(-1, self.dim)
+        table = self.table
+        duplicates = [None] * len(vectors_np)
+        if candidate_ids is not None:
+            for i, memory_ids in enumerate(candidate_ids):
+                rows = table.rows_of(list(memory_ids))
+                rows = rows[rows != MISSING]
+                rows = rows[table.unexpired(rows, time.time())]
+                if not len(rows):
+                    continue
+                existing = table.vectors(rows)
+                norms = np.maximum(np.linalg.norm(existing, axis=1) * np.linalg.norm(vectors_np[i]), 1e-12)
+                similarities = existing @ vectors_np[i] / norms
+                best = int(np.argmax(similarities))
+                if similarities[best] >= min_similarity:
+                    duplicates[i] = int(table.ids[rows[best]])
+            return duplicates
+
+        nearest = self.search_batch(vectors_np, 1, memory_types=list(memory_types))
+
+        for i, results in enumerate(nearest):
+            if not results:
+                continue
+            row = table.row_of(results[0]["id"])
+            if row is None:
+                continue
+            existing = table.vectors([row])[0]
+            norms = max(float(np.linalg.norm(existing) * np.linalg.norm(vectors_np[i])), 1e-12)
+            if float(existing @ vectors_np[i]) / norms >= min_similarity:
+                duplicates[i] = results[0]["id"]
+        return duplicates
+
+    def similarity(self, embedding, memory_ids):
+        """
+        Exact ``1 / (1 + squared L2)`` scores of live memories against one
+        query vector (None for IDs that are not live).
+        """
+        table = self.table
+        rows = table.rows_of(memory_ids)
+        found = rows != MISSING
+        query_np = np.asarray(embedding, dtype="float32").reshape(self.dim)
+        distances = _squared_distances(table.vectors(rows[found]), query_np)
+
+        scores = [None] * len(rows)
+        for i, distance in zip(np.flatnonzero(found), distances.tolist()):
+            scores[i] = 1 / (1 + distance)
+        return scores
+
+    def _search_group(self, version, table, vectors_np, top_k, ef_search, nprobe, memory_type, now):
+        """
+        (distance, table row) candidates for each query row, nearest first,
+        without memories expired by ``now``.
+        """
+        compressed = version.precision != "float32" or version.kind == "ivfpq"
+        # Over-fetch to make up for expired memories the sweeper has not
+        # removed yet
+        fetch_k = (top_k * RERANK_FACTOR if compressed else top_k) + table.expired_count(now, memory_type)
+
+        # Rows not yet merged into the published index are searched exactly
+        delta_rows = table.rows_from(version.next_id)
+        delta_rows = delta_rows[table.unexpired(delta_rows, now)]
+
+        selector = None
+        if memory_type:
+            type_count = table.type_count(memory_type)
+            if type_count == 0:
+                return [[] for _ in range(len(vectors_np))]
+            # Only live IDs are selected, so masked deletions need no over-fetch
+            selector = self._type_selector(memory_type)
+            delta_rows = table.filter_type(delta_rows, memory_type)
+            k = min(fetch_k, type_count)
+        else:
+            # Over-fetch to make up for masked deletions
+            k = min(fetch_k + len(version.dead), version.index.ntotal)
+
+        n_queries = len(vectors_np)
+        distances = np.empty((n_queries, 0), dtype="float32")
+        indices = np.empty((n_queries, 0), dtype="int64")
+        if k > 0 and version.index.ntotal:
+            distances, indices = version.index.search(
+                vectors_np, k, params=self._search_params(version.kind, ef_search, nprobe, selector)
+            )
+        delta_vectors = table.vectors(delta_rows) if len(delta_rows) else None
+
+        group_candidates = []
+        for row in range(n_queries):
+            # Padding (-1) and deleted IDs resolve to MISSING
+            table_rows = table.rows_of(indices[row])
+            found = table_rows != MISSING
+            found[found] = table.unexpired(table_rows[found], now)
+            if compressed and found.any():
+                candidates = self._rerank(table, vectors_np[row], table_rows[found])
+            else:
+                candidates = list(zip(distances[row][found].tolist(), table_rows[found].tolist()))
+
+            if delta_vectors is not None:
+                delta_distances = _squared_distances(delta_vectors, vectors_np[row])
+                candidates += zip(delta_distances.tolist(), delta_rows.tolist())
+                candidates.sort(key=lambda candidate: candidate[0])
+            group_candidates.append(candidates)
+        return group_candidates
+
+    def _blend(self, table, candidates, reranker, type_boosts, top_k):
+        """
+        Top ``top_k`` results of one query's candidates by blended score.
+        """
+        if not candidates:
+            return []
+        distances, table_rows = (np.array(column) for column in zip(*candidates))
+        scores = 1 / (1 + distances)
+        rank_scores = reranker.score(
+            scores,
+            table.confidence[table_rows],
+            table.created_at[table_rows],
+            type_boosts[table.type_codes[table_rows]]
+        )
+        order = np.argsort(-rank_scores, kind="stable")[:top_k]
+        return [
+            {
+                "id": int(table.ids[table_rows[i]]),
+                "memory": table.metadata(table_rows[i]),
+                "score": float(scores[i]),
+                "rank_score": float(rank_scores[i])
+            }
+            for i in order
+        ]
+
+    def _rerank(self, table, query_np, table_rows):
+        """
+        Exact squared L2 distances for compressed-index candidates, nearest first.
+        """
+        distances = _squared_distances(table.vectors(table_rows), query_np)
+        order = np.argsort(distances, kind="stable")
+        return [(float(distances[i]), int(table_rows[i])) for i in order]
+
+    def commit(self):
+        """
+        Make writes since the last commit durable by appending them to the
+        write-ahead log (one fsync per call).
+        """
+        self._check_writable()
+        with self.lock:
+            self.wal.append(self._wal_buffer)
+            self._wal_buffer = []
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Vector store at {self.index_path} is read-only")
+
     def save_index(self):
-        with open(self.index_path, "wb") as f:
-            pickle.dump((self.memory_map,), f)
+        """
+        Fold every change since the last save into the snapshot files and
+        clear the write-ahead log.
+
+        New rows are appended to the vector, ID and metadata files and
+        deletions are appended to the metadata log; nothing already on disk
+        is rewritten unless the files need compaction.
+        """
+        self._check_writable()
+        with self.lock:
+            if not os.path.exists(self._path(MANIFEST_FILE)) or self._needs_compaction():
+                self._write_snapshot()
+            else:
+                self._append_snapshot()
+
+            # The manifest now covers every logged operation
+            self._wal_buffer = []
+            self.wal.truncate()
+
+    def _append_snapshot(self):
+        table = self.table
+        start = table.base_rows
+        new_rows = range(start, table.n_rows)
+        if new_rows:
+            # Rows deleted before this save are written too, without metadata
+            self._append(self._data_path(VECTORS_FILE), table.tail_vectors().tobytes(), start * self.dim * 4)
+            self._append(self._data_path(IDS_FILE), table.ids[start:table.n_rows].tobytes(), start * 8)
+
+        records = [
+            {"id": int(table.ids[row]), "metadata": table.metadata(row)}
+            for row in new_rows if table.live[row]
+        ]
+        records += [{"id": memory_id, "deleted": True} for memory_id in self._pending_deletes]
+        if records:
+            self._metadata_size = self._append(
+                self._data_path(METADATA_FILE), _encode_records(records), self._metadata_size
+            )
+
+        self._map_vectors()
+        if self._index_stale():
+            self._write_index()
+        self._write_manifest()
+
+        self._pending_deletes = []
+
+    def _needs_compaction(self):
+        n_rows = self.table.n_rows
+        dead_rows = n_rows - len(self.table)
+        return n_rows >= COMPACTION_MIN_ROWS and dead_rows > COMPACTION_DEAD_RATIO * n_rows
+
+    def _index_stale(self):
+        rows = self.table.base_rows
+        return self._index_dirty or rows - self._index_rows >= max(
+            INDEX_SNAPSHOT_MIN_DELTA, INDEX_SNAPSHOT_DELTA_RATIO * rows
+        )
+
+    def _append(self, path, data, offset):
+        """
+        Write ``data`` at ``offset``, discarding anything past the last
+        committed size (left behind by an interrupted save).
+        """
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            f.write(data)
+        return offset + len(data)
+
+    def _replace(self, path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_index(self):
+        version = self.version
+        if self._delta_rows() or (version.dead and version.kind != "hnsw"):
+            # The file must cover every saved row
+            self._merge()
+
+        # Under a new name: the committed manifest still points at the old file
+        self._superseded.append(self._index_file_path())
+        self._index_generation += 1
+        tmp_path = self._index_file_path() + ".tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self._index_file_path())
+        self._index_rows = self.table.base_rows
+        self._index_dirty = False
+
+    def _write_manifest(self):
+        self._replace(self._path(MANIFEST_FILE), json.dumps({
+            "format": FORMAT_VERSION,
+            "generation": self._generation,
+            "index_generation": self._index_generation,
+            "dim": self.dim,
+            "next_id": self.next_id,
+            "rows": self.table.base_rows,
+            "metadata_size": self._metadata_size,
+            "index_kind": self.index_kind,
+            "index_precision": self.index_precision,
+            "index_rows": self._index_rows,
+            "wal_lsn": self.wal.next_lsn - 1
+        }).encode("utf-8"))
+
+        # Nothing refers to them any more. Followers that opened them keep
+        # their handles; removal fails harmlessly where files in use cannot
+        # be deleted.
+        for path in self._superseded:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._superseded = []
+
+    def _write_snapshot(self):
+        """
+        Rewrite every file from the live memories, dropping deleted rows,
+        as a new generation that takes effect with the manifest.
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+
+        # Dead rows are dropped and the old mapping released (the compacted
+        # table holds its vectors in RAM) before the new files are mapped
+        self.table = table = self.table.compacted()
+        self._invalidate_selectors()
+
+        if os.path.exists(self._path(MANIFEST_FILE)):
+            self._superseded += [self._data_path(filename) for filename in (VECTORS_FILE, IDS_FILE, METADATA_FILE)]
+            self._generation += 1
+        self._replace(self._data_path(VECTORS_FILE), table.base_vectors.tobytes())
+        self._replace(self._data_path(IDS_FILE), table.ids[:table.n_rows].tobytes())
+        metadata = _encode_records(
+            {"id": int(table.ids[row]), "metadata": table.metadata(row)}
+            for row in range(table.n_rows)
+        )
+        self._replace(self._data_path(METADATA_FILE), metadata)
+
+        self._metadata_size = len(metadata)
+        self._map_vectors()
+        self._write_index()
+        self._write_manifest()
+
+        self._pending_deletes = []
+
+    def _map_vectors(self):
+        """
+        Re-open the vector file, which now holds every table row, as the
+        table's base.
+        """
+        n_rows = self.table.n_rows
+        vectors = None
+        if n_rows:
+            vectors = np.memmap(
+                self._data_path(VECTORS_FILE), dtype="float32", mode="r", shape=(n_rows, self.dim)
+            )
+        self.table.rebase(vectors)
 
     def load_index(self):
-        with open(self.index_path, "rb") as f:
-            (self.memory_map,) = pickle.load(f)
+        """
+        Load the snapshot (importing a legacy pickle if that is all there is)
+        and replay the write-ahead log on top of it.
+        """
+        manifest = {}
+        if os.path.exists(self._path(MANIFEST_FILE)):
+            for attempt in range(3):
+                try:
+                    manifest = self._load_snapshot()
+                    break
+                except FileNotFoundError:
+                    # A follower read the manifest just before the writer
+                    # committed a compaction and removed the files it named
+                    if not self.read_only or attempt == 2:
+                        raise
+        elif os.path.exists(self.legacy_path):
+            self._load_legacy_pickle()
+            if not self.read_only:
+                self._write_snapshot()
+
+        self._snapshot_lsn = self._applied_lsn = manifest.get("wal_lsn", 0)
+        if self.read_only:
+            if self._wal_tail is not None:
+                self._wal_tail.close()
+            self._wal_tail = WalTail(self._path(WAL_FILE))
+            self._apply(self._wal_tail.read())
+        else:
+            self._apply(self.wal.replay(after_lsn=self._applied_lsn))
+        self.write_version = next(_write_versions)
+
+    def _apply(self, records):
+        for record in records:
+            if record["lsn"] <= self._applied_lsn:
+                continue
+            if record["op"] == "add":
+                # IDs are never reused, so older IDs were folded into the snapshot
+                if record["id"] >= self.next_id:
+                    vector_np = decode_vector(record["embedding"]).reshape(1, self.dim)
+                    self._insert(record["id"], record["metadata"], vector_np)
+            elif record["op"] == "delete":
+                self._delete(record["ids"])
+            self._applied_lsn = record["lsn"]
+
+    def refresh(self):
+        """
+        Catch up with the writer of a read-only store. Newly logged writes
+        are applied in place; the snapshot is reloaded instead if the writer
+        folded writes into it before they could be read, or once enough
+        rows have piled up in RAM since the last load.
+        """
+        with self.lock:
+            if self._wal_tail is None:
+                if not any(os.path.exists(self._path(filename)) for filename in (MANIFEST_FILE, WAL_FILE)):
+                    return
+                self.load_index()
+                return
+
+            records = [record for record in self._wal_tail.read() if record["lsn"] > self._applied_lsn]
+            snapshot_lsn = self._manifest_lsn()
+            # A gap anywhere means a whole log generation went by unread
+            # (the writer snapshotted more than once since the last refresh)
+            lsns = [self._applied_lsn] + [record["lsn"] for record in records]
+            missed = (
+                any(lsn != previous + 1 for previous, lsn in zip(lsns, lsns[1:]))
+                or snapshot_lsn > lsns[-1]
+            )
+            grown = (
+                snapshot_lsn != self._snapshot_lsn
+                and self.table.n_rows - self.table.base_rows >= DELTA_MERGE_ROWS
+            )
+            if missed or grown:
+                self.load_index()
+            else:
+                self._apply(records)
+
+    def _manifest_lsn(self):
+        try:
+            with open(self._path(MANIFEST_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)["wal_lsn"]
+        except FileNotFoundError:
+            return 0
+
+    def _load_snapshot(self):
+        with open(self._path(MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        self.next_id = manifest["next_id"]
+        self._metadata_size = manifest["metadata_size"]
+        self._generation = manifest.get("generation", 0)
+        self._index_generation = manifest.get("index_generation", 0)
 
+        n_rows = manifest["rows"]
+        ids = np.fromfile(self._data_path(IDS_FILE), dtype="int64", count=n_rows)
+        vectors = None
+        if n_rows:
+            vectors = np.memmap(
+                self._data_path(VECTORS_FILE), dtype="float32", mode="r", shape=(n_rows, self.dim)
+            )
+
+        # Rows only become live once their metadata record is read
+        table = MemoryTable(self.dim, ids, vectors)
+        with open(self._data_path(METADATA_FILE), "rb") as f:
+            metadata = f.read(self._metadata_size)
+        for line in metadata.splitlines():
+            record = json.loads(line)
+            if record.get("deleted"):
+                table.delete(record["id"])
+            else:
+                table.restore(record["id"], record["metadata"])
+        self.table = table
+        self.lexical = _build_lexical_index(table)
+
+        self._pending_deletes = []
+        self._invalidate_selectors()
+        self._load_native_index(manifest)
+        return manifest
+
+    def _load_native_index(self, manifest):
+        """
+        Read the serialized index and bring it up to date with the rows and
+        deletions written after it.
+        """
+        index_kind = manifest.get("index_kind")
+        index_precision = manifest.get("index_precision", "float32")
+        table = self.table
+        n_vectors = len(table)
+        usable = (
+            index_kind == self._resolve_index_kind(n_vectors)
+            or (self.index_type == "auto" and index_kind == self.ann_index_type)
+        ) and index_precision in (self._resolve_precision(n_vectors), self.precision)
+        if not usable or not os.path.exists(self._index_file_path()):
+            self.rebuild_index()
+            return
+
+        # Not published yet, so it can still be brought up to date in place
+        index = faiss.read_index(self._index_file_path())
+        if index_kind in ("ivf", "ivfpq") and not isinstance(index, faiss.IndexIVF):
+            # Written with an ID map around the IVF index, which removals corrupt
+            self.rebuild_index()
+            return
+        self._index_rows = manifest["index_rows"]
+        self._index_dirty = False
+
+        new_rows = np.arange(self._index_rows, table.n_rows)
+        new_rows = new_rows[table.live[new_rows]]
+        if len(new_rows):
+            index.add_with_ids(table.vectors(new_rows), table.ids[new_rows])
+
+        dead_ids = np.setdiff1d(indexed_ids(index), table.live_ids())
+        if dead_ids.size and index_kind != "hnsw":
+            index.remove_ids(dead_ids)
+            dead_ids = dead_ids[:0]
+        self._publish(index, index_kind, index_precision, set(dead_ids.tolist()))
+
+        if len(self.version.dead) > TOMBSTONE_REBUILD_RATIO * index.ntotal:
+            self.rebuild_index()
+
+    def _load_legacy_pickle(self):
+        with open(self.legacy_path, "rb") as f:
+            data = pickle.load(f)
+
+        if len(data) == 1:
+            # Oldest format: a positional list of memories without IDs
+            (memories,) = data
+            memory_map = dict(enumerate(memories))
+            self.next_id = len(memories)
+        else:
+            memory_map, self.next_id = data
+
+        table = MemoryTable(self.dim)
+        for memory_id, memory in sorted(memory_map.items(), key=lambda item: item[0]):
+            table.append(memory_id, memory["metadata"], np.asarray(memory["embedding"], dtype="float32"))
+        self.table = table
+        self.lexical = _build_lexical_index(table)
+        self._invalidate_selectors()
         self.rebuild_index()
+
+
+def _generation_file(filename, generation):
+    # Generation 0 keeps the plain names of the original layout
+    if not generation:
+        return filename
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}.{generation}{extension}"
+
+
+def _build_lexical_index(table):
+    lexical = LexicalIndex()
+    for row in table.live_rows():
+        lexical.add(int(table.ids[row]), table.keys.string(table.key_codes[row]), table.values[row])
+    return lexical
+
+
+def _squared_distances(vectors_np, query_np):
+    return ((vectors_np - query_np) ** 2).sum(axis=1)
+
+
+def _encode_records(records):
+    return b"".join(
+        (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records
+    )
@@ -0,0 +1,178 @@
+import base64
+import json
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_COMPACTION_INTERVAL = float(os.getenv("WAL_COMPACTION_INTERVAL", "30"))
+
+
+def encode_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype="float32").tobytes()).decode("ascii")
+
+
+def decode_vector(encoded):
+    return np.frombuffer(base64.b64decode(encoded), dtype="float32")
+
+
+class WriteAheadLog:
+    """
+    Append-only JSON-lines log of store operations.
+
+    Each batch of records is written with a single fsync. Records carry a
+    monotonically increasing log sequence number (``lsn``) so replay can
+    skip operations that were already folded into a snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.next_lsn = 1
+        self.record_count = 0
+
+    def append(self, records):
+        if not records:
+            return
+
+        lines = []
+        for record in records:
+            lines.append(json.dumps(dict(record, lsn=self.next_lsn), ensure_ascii=False) + "\n")
+            self.next_lsn += 1
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self.record_count += len(records)
+
+    def replay(self, after_lsn=0):
+        """
+        Return records with ``lsn > after_lsn``. A torn trailing record from
+        an interrupted append is dropped from the file.
+        """
+        self.next_lsn = max(self.next_lsn, after_lsn + 1)
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_size += len(line)
+                self.next_lsn = max(self.next_lsn, record["lsn"] + 1)
+                if record["lsn"] > after_lsn:
+                    records.append(record)
+
+        if valid_size != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        self.record_count = len(records)
+        return records
+
+    def truncate(self):
+        # Replaced rather than truncated in place, so a WalTail in another
+        # process can finish reading the old file
+        if os.path.exists(self.path):
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb"):
+                pass
+            os.replace(tmp_path, self.path)
+        self.record_count = 0
+
+
+class WalTail:
+    """
+    Read-only follower of a write-ahead log appended to by another process.
+
+    ``read()`` returns the complete records added since the previous call.
+    When the writer replaces the log after a snapshot, the rest of the old
+    file is read before switching to the new one; callers detect records
+    they missed entirely from gaps in the log sequence numbers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._offset = 0
+
+    def read(self):
+        records = []
+        while True:
+            if self._file is None:
+                try:
+                    self._file = open(self.path, "rb")
+                except FileNotFoundError:
+                    return records
+                self._offset = 0
+
+            # Checked before reading: a replaced file receives no more appends
+            replaced = self._replaced()
+            self._file.seek(self._offset)
+            data = self._file.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                records.append(json.loads(line))
+            self._offset += len(complete)
+
+            if not replaced:
+                return records
+            self.close()
+
+    def _replaced(self):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class WalCompactor:
+    """
+    Background thread that periodically folds write-ahead logs into
+    snapshots, keeping snapshot writes off the request path.
+    """
+
+    def __init__(self, get_stores, interval=None):
+        self.get_stores = get_stores
+        self.interval = interval if interval is not None else DEFAULT_COMPACTION_INTERVAL
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="wal-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def compact_all(self):
+        compacted = 0
+        for store in self.get_stores():
+            if store.wal.record_count:
+                store.save_index()
+                compacted += 1
+        return compacted
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.compact_all()
+            except Exception as e:
+                print(f"[WalCompactor] Compaction failed: {e}")
@@ -4,7 +4,7 @@ from typing import Optional, List, Dict
 
 class ChatRequest(BaseModel):
     """Request model for chat endpoint"""
-    user_id: str = Field(..., description="Unique user identifier")
+    user_id: str = Field(..., min_length=1, description="Unique user identifier")
     message: str = Field(..., description="User's message/query")
     conversation_history: Optional[List[Dict[str, str]]] = Field(
         default=None,
@@ -14,18 +14,50 @@ class ChatRequest(BaseModel):
 
 class MemoryRetrievalRequest(BaseModel):
     """Request model for memory retrieval"""
-    user_id: str = Field(..., description="Unique user identifier")
+    user_id: str = Field(..., min_length=1, description="Unique user identifier")
     query: str = Field(..., description="Query to search memories")
     top_k: Optional[int] = Field(default=5, description="Number of memories to retrieve")
     memory_type: Optional[str] = Field(
         default=None,
         description="Filter by memory type: preference, fact, constraint, commitment"
     )
+    ef_search: Optional[int] = Field(
+        default=None,
+        description="HNSW search depth (only used once the user's index is HNSW)"
+    )
+    nprobe: Optional[int] = Field(
+        default=None,
+        description="IVF lists to probe (only used once the user's index is IVF)"
+    )
+
+
+class BatchQuery(BaseModel):
+    """A single query within a batch retrieval request"""
+    query: str = Field(..., description="Query to search memories")
+    top_k: Optional[int] = Field(default=5, description="Number of memories to retrieve")
+    memory_type: Optional[str] = Field(
+        default=None,
+        description="Filter by memory type: preference, fact, constraint, commitment"
+    )
+
+
+class MemoryBatchRetrievalRequest(BaseModel):
+    """Request model for batched memory retrieval"""
+    user_id: str = Field(..., min_length=1, description="Unique user identifier")
+    queries: List[BatchQuery] = Field(..., description="Queries to search memories for")
+    ef_search: Optional[int] = Field(
+        default=None,
+        description="HNSW search depth (only used once the user's index is HNSW)"
+    )
+    nprobe: Optional[int] = Field(
+        default=None,
+        description="IVF lists to probe (only used once the user's index is IVF)"
+    )
 
 
 class MemoryExtractionRequest(BaseModel):
     """Request model for memory extraction"""
-    user_id: str = Field(..., description="Unique user identifier")
+    user_id: str = Field(..., min_length=1, description="Unique user identifier")
     conversation_history: List[Dict[str, str]] = Field(
         ...,
         description="Conversation history to extract memories from"
@@ -20,6 +20,18 @@ class MemoryRetrievalResponse(BaseModel):
     latency_ms: int = Field(..., description="Retrieval time in milliseconds")
 
 
+class MemoryBatchRetrievalResult(BaseModel):
+    """Memories retrieved for one query of a batch"""
+    memories: List[Dict[str, Any]] = Field(..., description="Retrieved memories")
+    count: int = Field(..., description="Number of memories retrieved")
+
+
+class MemoryBatchRetrievalResponse(BaseModel):
+    """Response model for batched memory retrieval"""
+    results: List[MemoryBatchRetrievalResult] = Field(..., description="Results in query order")
+    latency_ms: int = Field(..., description="Retrieval time in milliseconds")
+
+
 class MemoryExtractionResponse(BaseModel):
     """Response model for memory extraction"""
     extracted_count: int = Field(..., description="Number of memories extracted")
@@ -43,4 +55,16 @@ class MetricsResponse(BaseModel):
     avg_latency_ms: float = Field(..., description="Average latency in milliseconds")
     avg_memory_retrieval_ms: float = Field(..., description="Average memory retrieval time")
     avg_llm_inference_ms: float = Field(..., description="Average LLM inference time")
-    total_memories_stored: int = Field(..., description="Total memories in storage")
+    total_memories_stored: int = Field(..., description="Total memories in resident user shards")
+    embedding_cache: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Embedding cache hits, misses, hit rate and size"
+    )
+    retrieval_cache: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Retrieval result cache hits, misses, hit rate and size"
+    )
+    extraction_queue: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Conversations awaiting memory extraction (depth, in flight, lag) and throughput"
+    )
@@ -1,6 +1,14 @@
 from fastapi import APIRouter, HTTPException
-from orchestrator.api.models.requests import ChatRequest, MemoryRetrievalRequest
-from orchestrator.api.models.responses import ChatResponse, MemoryRetrievalResponse
+from orchestrator.api.models.requests import (
+    ChatRequest,
+    MemoryRetrievalRequest,
+    MemoryBatchRetrievalRequest
+)
+from orchestrator.api.models.responses import (
+    ChatResponse,
+    MemoryRetrievalResponse,
+    MemoryBatchRetrievalResponse
+)
 from orchestrator.services.orchestrator import ChatOrchestrator
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -18,7 +26,7 @@ async def chat(request: ChatRequest):
     1. Retrieve relevant memories
     2. Build context-aware prompt
     3. Generate LLM response
-    4. Extract and store new memories
+    4. Queue the exchange for memory extraction (in the background)
     5. Return response with metadata
     """
     try:
@@ -40,14 +48,39 @@ async def retrieve_memories(request: MemoryRetrievalRequest):
     Retrieve relevant memories for a query without generating a response
     """
     try:
-        result = orchestrator.retrieve_memories(
+        result = await orchestrator.retrieve_memories(
             user_id=request.user_id,
             query=request.query,
             top_k=request.top_k,
-            memory_type=request.memory_type
+            memory_type=request.memory_type,
+            ef_search=request.ef_search,
+            nprobe=request.nprobe
         )
         
         return MemoryRetrievalResponse(**result)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Memory retrieval failed: {str(e)}")
+
+
+@router.post("/retrieve/batch", response_model=MemoryBatchRetrievalResponse)
+async def retrieve_memories_batch(request: MemoryBatchRetrievalRequest):
+    """
+    Retrieve memories for several queries at once (one embedding call,
+    one vector search pass)
+    """
+    try:
+        result = await orchestrator.retrieve_memories_batch(
+            user_id=request.user_id,
+            queries=[
+                {"query": query.query, "top_k": query.top_k, "memory_type": query.memory_type}
+                for query in request.queries
+            ],
+            ef_search=request.ef_search,
+            nprobe=request.nprobe
+        )
+        
+        return MemoryBatchRetrievalResponse(**result)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch memory retrieval failed: {str(e)}")
@@ -1,12 +1,9 @@
 from fastapi import APIRouter
 from orchestrator.api.models.responses import HealthResponse, MetricsResponse
-from orchestrator.services.orchestrator import ChatOrchestrator
+from orchestrator.api.routes.chat import orchestrator
 
 router = APIRouter(tags=["health"])
 
-# Initialize orchestrator (singleton pattern)
-orchestrator = ChatOrchestrator()
-
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
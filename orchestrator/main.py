@@ -1,13 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from memory_manager import embedding_service
 from orchestrator.api.routes import chat, health
 from orchestrator.middleware.logging import LoggingMiddleware
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model before serving the first request
+    if embedding_service.WARM_UP_ON_START:
+        embedding_service.warm_up()
+    # Resume memory extraction of conversations queued before a restart
+    chat.orchestrator.start()
+    yield
+    # Fold write-ahead logs into snapshots before exiting
+    await chat.orchestrator.shutdown()
+    embedding_service.shutdown()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="AI Memory System Orchestrator",
     description="System orchestrator for AI memory-augmented chat",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from itertools import chain
+from memory_manager.serving import WriterLock
+
+# Conversations waiting for extraction are spooled here, one subdirectory
+# per server process
+DEFAULT_EXTRACTION_QUEUE_DIR = os.getenv("EXTRACTION_QUEUE_DIR", "orchestrator/extraction_queue")
+# Concurrent extractions (each for a different user)
+DEFAULT_EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+# Conversations of one user extracted together, at most
+DEFAULT_EXTRACTION_MAX_BATCH = int(os.getenv("EXTRACTION_MAX_BATCH", "16"))
+# A failed extraction (provider error, timeout) is retried after
+# RETRY_BACKOFF seconds, doubling each time, until it has been attempted
+# MAX_ATTEMPTS times; then it is set aside
+DEFAULT_EXTRACTION_MAX_ATTEMPTS = int(os.getenv("EXTRACTION_MAX_ATTEMPTS", "4"))
+DEFAULT_EXTRACTION_RETRY_BACKOFF = float(os.getenv("EXTRACTION_RETRY_BACKOFF", "2"))
+# Seconds given to the queue to empty on shutdown; the rest is picked up
+# on the next start
+DEFAULT_EXTRACTION_DRAIN_TIMEOUT = float(os.getenv("EXTRACTION_DRAIN_TIMEOUT", "10"))
+
+OWNER_LOCK = "owner.lock"
+
+
+class ExtractionQueue:
+    """
+    Durable queue of conversations waiting for memory extraction, worked off
+    by asyncio tasks in the serving event loop.
+
+    Each conversation is spooled to a JSON file before ``enqueue`` returns
+    and removed once ``handler`` has stored its memories, so conversations
+    accepted before a crash are extracted after the next start (at least
+    once). Every process spools into its own subdirectory, guarded by a lock
+    the OS releases when the process exits; spools left without an owner
+    are adopted on start.
+
+    A worker takes every conversation pending for one user (up to
+    ``max_batch``) and passes them to ``handler(user_id, conversations)``
+    together, so a burst of messages costs one extraction call and one
+    store. A user is handled by at most one worker at a time, which keeps
+    their writes in order. A failed batch is retried with exponential
+    backoff (the user's later conversations wait for it) and set aside as
+    ``.failed`` files after ``max_attempts``.
+    """
+
+    def __init__(self, handler, path=None, workers=None, max_batch=None,
+                 max_attempts=None, retry_backoff=None):
+        self.handler = handler
+        self.path = path if path is not None else DEFAULT_EXTRACTION_QUEUE_DIR
+        self.workers = workers or DEFAULT_EXTRACTION_WORKERS
+        self.max_batch = max_batch or DEFAULT_EXTRACTION_MAX_BATCH
+        self.max_attempts = max_attempts or DEFAULT_EXTRACTION_MAX_ATTEMPTS
+        self.retry_backoff = retry_backoff if retry_backoff is not None else DEFAULT_EXTRACTION_RETRY_BACKOFF
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        # user_id -> entries, users in order of their oldest entry
+        self._pending = {}
+        # user_id -> entries being extracted
+        self._active = {}
+        # user_id -> entries waiting to be retried, with the timer handle
+        self._backoff = {}
+        self._wakeup = None
+        self._tasks = []
+        self._spool = None
+        self._owner_lock = None
+
+    def start(self):
+        """
+        Recover spooled conversations and start the workers. Must be called
+        from the event loop; ``enqueue`` calls it on first use.
+        """
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._spool = os.path.join(self.path, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(self._spool, exist_ok=True)
+        self._owner_lock = _lock_spool(self._spool)
+        self._adopt_orphaned_spools()
+
+        recovered = 0
+        for name in sorted(os.listdir(self._spool)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self._spool, name)
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["path"] = path
+            self._pending.setdefault(entry["user_id"], []).append(entry)
+            recovered += 1
+        if recovered:
+            print(f"[ExtractionQueue] Recovered {recovered} conversations awaiting extraction")
+
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def enqueue(self, user_id, conversation):
+        """
+        Spool ``conversation`` (a list of chat messages) and queue it for
+        extraction.
+        """
+        self.start()
+        entry = {"user_id": user_id, "conversation": conversation, "enqueued_at": time.time()}
+        path = os.path.join(self._spool, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+        entry["path"] = path
+        self._pending.setdefault(user_id, []).append(entry)
+        self._wakeup.set()
+
+    async def stop(self, timeout=None):
+        """
+        Give the workers up to ``timeout`` seconds to empty the queue, then
+        stop them. Whatever is left stays spooled for the next start.
+        """
+        if not self._tasks:
+            return
+        timeout = timeout if timeout is not None else DEFAULT_EXTRACTION_DRAIN_TIMEOUT
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._pending or self._active or self._backoff) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for _, timer in self._backoff.values():
+            timer.cancel()
+        self._tasks = []
+        self._pending.clear()
+        self._active.clear()
+        self._backoff.clear()
+
+        self._owner_lock.release()
+        if os.listdir(self._spool) == [OWNER_LOCK]:
+            shutil.rmtree(self._spool, ignore_errors=True)
+
+    def stats(self):
+        pending = sum(len(entries) for entries in self._pending.values())
+        in_flight = sum(len(entries) for entries in self._active.values())
+        retrying = [entries for entries, _ in self._backoff.values()]
+        oldest = min(
+            (entries[0]["enqueued_at"] for entries in chain(self._pending.values(), self._active.values(), retrying)),
+            default=None
+        )
+        return {
+            "depth": pending,
+            "in_flight": in_flight,
+            "retrying": sum(len(entries) for entries in retrying),
+            # Age of the oldest conversation not yet stored
+            "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "avg_batch_size": round(self.processed / self.batches, 2) if self.batches else 0.0
+        }
+
+    async def _work(self):
+        while True:
+            user_id = next(
+                (user_id for user_id in self._pending if user_id not in self._active and user_id not in self._backoff),
+                None
+            )
+            if user_id is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            entries = self._pending.pop(user_id)
+            if len(entries) > self.max_batch:
+                entries, self._pending[user_id] = entries[:self.max_batch], entries[self.max_batch:]
+            self._active[user_id] = entries
+            try:
+                await self.handler(user_id, [entry["conversation"] for entry in entries])
+            except Exception as e:
+                self._retry_or_set_aside(user_id, entries, e)
+            else:
+                for entry in entries:
+                    os.remove(entry["path"])
+                self.processed += len(entries)
+                self.batches += 1
+            finally:
+                # On cancellation the entries stay spooled for the next start
+                del self._active[user_id]
+                self._wakeup.set()
+
+    def _retry_or_set_aside(self, user_id, entries, error):
+        attempts = max(entry.get("attempts", 0) for entry in entries) + 1
+        if attempts < self.max_attempts:
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            print(f"[ExtractionQueue] Extraction for user {user_id} failed (attempt {attempts}/"
+                  f"{self.max_attempts}), retrying in {delay:.1f}s: {error!r}")
+            for entry in entries:
+                entry["attempts"] = attempts
+            timer = asyncio.get_running_loop().call_later(delay, self._retry, user_id)
+            self._backoff[user_id] = (entries, timer)
+            self.retried += len(entries)
+            return
+
+        # Set aside so a conversation that cannot be extracted is not retried forever
+        print(f"[ExtractionQueue] Extraction for user {user_id} failed after {attempts} attempts: {error!r}")
+        for entry in entries:
+            os.replace(entry["path"], entry["path"] + ".failed")
+        self.failed += len(entries)
+
+    def _retry(self, user_id):
+        entries, _ = self._backoff.pop(user_id)
+        # Ahead of the user's newer conversations
+        self._pending[user_id] = entries + self._pending.pop(user_id, [])
+        self._wakeup.set()
+
+    def _adopt_orphaned_spools(self):
+        for name in sorted(os.listdir(self.path)):
+            spool = os.path.join(self.path, name)
+            if spool == self._spool or not os.path.isdir(spool):
+                continue
+            lock = _lock_spool(spool)
+            if lock is None:
+                # Its process is still running
+                continue
+            for file_name in os.listdir(spool):
+                if file_name != OWNER_LOCK:
+                    os.replace(os.path.join(spool, file_name), os.path.join(self._spool, file_name))
+            lock.release()
+            shutil.rmtree(spool, ignore_errors=True)
+
+
+def _lock_spool(spool):
+    """
+    Take the owner lock of ``spool``; None if another process holds it.
+    """
+    lock = WriterLock(os.path.join(spool, OWNER_LOCK))
+    try:
+        return lock if lock.acquire() else None
+    except RuntimeError:
+        # No file locks on this platform: a single server process is assumed
+        return lock
@@ -1,12 +1,14 @@
 import os
 import json
+import asyncio
+import httpx
 import requests
 from typing import Optional
 from dotenv import load_dotenv
 
 # Try to import OpenAI and Gemini, but don't fail if not available
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
@@ -21,15 +23,29 @@ except ImportError:
 
 load_dotenv()
 
+# Seconds a single provider may take before the next one is tried
+LLM_PROVIDER_TIMEOUT = float(os.getenv("LLM_PROVIDER_TIMEOUT", "20"))
+
 
 class LLMClient:
-    """Unified LLM client supporting OpenAI, Gemini, Ollama, and Local fallback"""
+    """
+    Unified LLM client supporting OpenAI, Gemini, Ollama, and Local fallback.
+
+    Provider calls are asynchronous (AsyncOpenAI, the Gemini SDK's aio
+    client, httpx for Ollama), so a slow provider never blocks the event
+    loop; each is bounded by LLM_PROVIDER_TIMEOUT before falling through to
+    the next.
+    """
     
     def __init__(self):
         self.openai_client = self._init_openai()
         self.gemini_key = self._init_gemini()
+        self.gemini_client = genai.Client(api_key=self.gemini_key) if self.gemini_key else None
         self.ollama_url = self._init_ollama()
         self.use_local_fallback = os.getenv("USE_LOCAL_FALLBACK", "true").lower() == "true"
+        self.provider_timeout = LLM_PROVIDER_TIMEOUT
+        # Created on first use, inside the serving event loop
+        self._http_client = None
         
     def _init_openai(self) -> Optional[object]:
         """Initialize OpenAI client if API key is available"""
@@ -39,7 +55,7 @@ class LLMClient:
         if not api_key or "your_actual_api_key_here" in api_key or api_key.strip() == "":
             return None
         try:
-            return OpenAI(api_key=api_key)
+            return AsyncOpenAI(api_key=api_key, timeout=LLM_PROVIDER_TIMEOUT)
         except:
             return None
     
@@ -64,7 +80,7 @@ class LLMClient:
             pass
         return None
     
-    def _generate_with_ollama(self, prompt: str, system_prompt: Optional[str] = None, temperature: float = 0.7) -> Optional[str]:
+    async def _generate_with_ollama(self, prompt: str, system_prompt: Optional[str] = None, temperature: float = 0.7) -> Optional[str]:
         """Generate response using Ollama"""
         if not self.ollama_url:
             return None
@@ -73,21 +89,22 @@ class LLMClient:
             model = os.getenv("OLLAMA_MODEL", "llama2")
             full_prompt = f"{system_prompt}\n\nUser: {prompt}\n\nAssistant:" if system_prompt else prompt
             
-            response = requests.post(
+            if self._http_client is None:
+                self._http_client = httpx.AsyncClient(timeout=self.provider_timeout)
+            response = await self._http_client.post(
                 f"{self.ollama_url}/api/generate",
                 json={
                     "model": model,
                     "prompt": full_prompt,
                     "temperature": temperature,
                     "stream": False
-                },
-                timeout=30
+                }
             )
             
             if response.status_code == 200:
                 return response.json().get("response", "")
         except Exception as e:
-            print(f"[LLMClient] Ollama failed: {e}")
+            print(f"[LLMClient] Ollama failed: {e!r}")
         
         return None
     
@@ -131,7 +148,7 @@ class LLMClient:
         else:
             return "Thank you for your message! I'm currently running in local mode. I can help you store and retrieve information from our conversations. What would you like to know?"
     
-    def generate(self, prompt: str, system_prompt: Optional[str] = None, temperature: float = 0.7) -> str:
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None, temperature: float = 0.7) -> str:
         """
         Generate response using available LLM provider
         
@@ -157,37 +174,46 @@ class LLMClient:
                     messages.append({"role": "system", "content": system_prompt})
                 messages.append({"role": "user", "content": prompt})
                 
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    temperature=temperature,
-                    messages=messages
+                response = await asyncio.wait_for(
+                    self.openai_client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        temperature=temperature,
+                        messages=messages
+                    ),
+                    self.provider_timeout
                 )
                 print("[LLMClient] Using OpenAI")
                 return response.choices[0].message.content
             except Exception as e:
-                print(f"[LLMClient] OpenAI failed: {e}")
+                print(f"[LLMClient] OpenAI failed: {e!r}")
         
         # Try Gemini as fallback
-        if self.gemini_key and GEMINI_AVAILABLE:
+        if self.gemini_client:
             try:
-                client = genai.Client(api_key=self.gemini_key)
                 full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
                 
-                response = client.models.generate_content(
-                    model='gemini-2.0-flash',
-                    contents=full_prompt
+                response = await asyncio.wait_for(
+                    self.gemini_client.aio.models.generate_content(
+                        model='gemini-2.0-flash',
+                        contents=full_prompt
+                    ),
+                    self.provider_timeout
                 )
                 print("[LLMClient] Using Gemini")
                 return response.text
             except Exception as e:
-                print(f"[LLMClient] Gemini failed: {e}")
+                print(f"[LLMClient] Gemini failed: {e!r}")
         
         # Try Ollama
-        ollama_response = self._generate_with_ollama(prompt, system_prompt, temperature)
+        ollama_response = await self._generate_with_ollama(prompt, system_prompt, temperature)
         if ollama_response:
             print("[LLMClient] Using Ollama")
             return ollama_response
         
+        return self.fallback_response(prompt, system_prompt)
+    
+    def fallback_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """Response used when no provider answered (in time)"""
         # Use local fallback
         if self.use_local_fallback:
             print("[LLMClient] Using local fallback (rule-based)")
@@ -195,6 +221,14 @@ class LLMClient:
         
         return "I apologize, but I'm currently unable to process your request. Please configure an LLM provider (OpenAI, Gemini, or Ollama)."
     
+    async def aclose(self):
+        """Close the HTTP connections held for providers"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self.openai_client is not None:
+            await self.openai_client.close()
+    
     def is_available(self) -> bool:
         """Check if any LLM provider is available"""
         return (self.openai_client is not None or 
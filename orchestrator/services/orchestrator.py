@@ -1,12 +1,22 @@
+import asyncio
 import time
-import json
 import os
 from typing import Dict, Any, List
 from memory_manager.memory_engine import MemoryEngine
-from extractor.extract_memory import extract_memory_from_chat
+from memory_manager.embedding_service import embedding_cache_stats
+from extractor.extract_memory import aextract_memories
+from orchestrator.services.extraction_queue import ExtractionQueue
 from orchestrator.services.llm_client import LLMClient
 from orchestrator.services.prompt_builder import PromptBuilder
 
+# Per-stage time limits of a chat request, in seconds. A retrieval that runs
+# over is answered without memories, an LLM call that runs over with the
+# local fallback, and an extraction that runs over stores nothing (and is
+# retried, then set aside, by the extraction queue).
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "2"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "30"))
+
 
 class ChatOrchestrator:
     """
@@ -25,6 +35,11 @@ class ChatOrchestrator:
         # Load memory extraction prompt
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         self.memory_prompt_path = os.path.join(base_dir, "prompts", "memory_prompt.txt")
+        with open(self.memory_prompt_path, 'r', encoding='utf-8') as f:
+            self.memory_prompt = f.read()
+        
+        # Memory extraction runs after the response is sent, coalesced per user
+        self.extraction_queue = ExtractionQueue(self._extract_and_store_memories)
         
         # Metrics tracking
         self.metrics = {
@@ -56,11 +71,20 @@ class ChatOrchestrator:
         
         # Step 1: Retrieve relevant memories
         retrieval_start = time.time()
-        memories = self.memory_engine.retrieve_memories(
-            query_text=message,
-            top_k=5,
-            score_threshold=0.3
-        )
+        # Off the event loop, so other requests proceed while this one embeds
+        try:
+            memories = await asyncio.wait_for(
+                self.memory_engine.aretrieve_memories(
+                    query_text=message,
+                    top_k=5,
+                    score_threshold=0.3,
+                    user_id=user_id
+                ),
+                RETRIEVAL_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print(f"[Orchestrator] Memory retrieval timed out after {RETRIEVAL_TIMEOUT}s; answering without memories")
+            memories = []
         timings['retrieval_ms'] = int((time.time() - retrieval_start) * 1000)
         self.metrics['total_retrieval_time'] += time.time() - retrieval_start
         
@@ -71,18 +95,27 @@ class ChatOrchestrator:
         
         # Step 3: Generate LLM response
         llm_start = time.time()
-        full_prompt = f"{system_prompt}\n\nUser: {user_prompt}\n\nAssistant:"
-        response = self.llm_client.generate(
-            prompt=user_prompt,
-            system_prompt=system_prompt,
-            temperature=0.7
-        )
+        try:
+            response = await asyncio.wait_for(
+                self.llm_client.generate(
+                    prompt=user_prompt,
+                    system_prompt=system_prompt,
+                    temperature=0.7
+                ),
+                LLM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print(f"[Orchestrator] LLM call timed out after {LLM_TIMEOUT}s; using the fallback response")
+            response = self.llm_client.fallback_response(user_prompt, system_prompt)
         timings['llm_ms'] = int((time.time() - llm_start) * 1000)
         self.metrics['total_llm_time'] += time.time() - llm_start
         
-        # Step 4: Extract and store new memories (background task)
+        # Step 4: Queue the exchange for memory extraction (background task)
         extraction_start = time.time()
-        self._extract_and_store_memories(user_id, message, response, conversation_history)
+        conversation = list(conversation_history or [])
+        conversation.append({"role": "user", "content": message})
+        conversation.append({"role": "assistant", "content": response})
+        self.extraction_queue.enqueue(user_id, conversation)
         timings['extraction_ms'] = int((time.time() - extraction_start) * 1000)
         self.metrics['total_extraction_time'] += time.time() - extraction_start
         
@@ -99,56 +132,51 @@ class ChatOrchestrator:
             "metadata": timings
         }
     
-    def _extract_and_store_memories(
+    async def _extract_and_store_memories(
         self,
         user_id: str,
-        user_message: str,
-        assistant_response: str,
-        conversation_history: List[Dict[str, str]] = None
+        conversations: List[List[Dict[str, str]]]
     ):
-        """Extract memories from conversation and store them"""
-        try:
-            # Build conversation for extraction
-            conversation = conversation_history or []
-            conversation.append({"role": "user", "content": user_message})
-            conversation.append({"role": "assistant", "content": assistant_response})
-            
-            # Save to temporary file for extraction
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                json.dump(conversation, f)
-                temp_path = f.name
-            
-            try:
-                # Extract memories
-                extraction_result = extract_memory_from_chat(temp_path, self.memory_prompt_path)
-                
-                # Store memories
-                if extraction_result and extraction_result.get("memories"):
-                    self.memory_engine.store_memories(extraction_result)
-                    print(f"[Orchestrator] Stored {len(extraction_result['memories'])} new memories for user {user_id}")
-            finally:
-                # Clean up temp file
-                os.unlink(temp_path)
-                
-        except Exception as e:
-            print(f"[Orchestrator] Memory extraction failed: {e}")
+        """
+        Extract memories from a user's queued conversations with one LLM call
+        and store them in one batch (run by the extraction queue, which
+        handles failures)
+        """
+        # Oldest first, so later statements win during extraction
+        conversation = _merge_conversations(conversations)
+        
+        # Extract memories
+        extraction_result = await asyncio.wait_for(
+            aextract_memories(conversation, self.memory_prompt),
+            EXTRACTION_TIMEOUT
+        )
+        
+        # Store memories
+        if extraction_result and extraction_result.get("memories"):
+            await self.memory_engine.astore_memories(extraction_result, user_id=user_id)
+            print(f"[Orchestrator] Stored {len(extraction_result['memories'])} new memories for user {user_id} "
+                  f"from {len(conversations)} conversations")
     
-    def retrieve_memories(
+    async def retrieve_memories(
         self,
         user_id: str,
         query: str,
         top_k: int = 5,
-        memory_type: str = None
+        memory_type: str = None,
+        ef_search: int = None,
+        nprobe: int = None
     ) -> Dict[str, Any]:
         """Retrieve memories for a user query"""
         start_time = time.time()
         
-        memories = self.memory_engine.retrieve_memories(
+        memories = await self.memory_engine.aretrieve_memories(
             query_text=query,
             top_k=top_k,
             score_threshold=0.3,
-            memory_type=memory_type
+            memory_type=memory_type,
+            user_id=user_id,
+            ef_search=ef_search,
+            nprobe=nprobe
         )
         
         latency_ms = int((time.time() - start_time) * 1000)
@@ -159,6 +187,41 @@ class ChatOrchestrator:
             "latency_ms": latency_ms
         }
     
+    async def retrieve_memories_batch(
+        self,
+        user_id: str,
+        queries: List[Dict[str, Any]],
+        ef_search: int = None,
+        nprobe: int = None
+    ) -> Dict[str, Any]:
+        """Retrieve memories for several queries in one pass"""
+        start_time = time.time()
+        
+        batch_results = await self.memory_engine.aretrieve_memories_batch(
+            [
+                {
+                    "query_text": query["query"],
+                    "top_k": query.get("top_k"),
+                    "score_threshold": 0.3,
+                    "memory_type": query.get("memory_type")
+                }
+                for query in queries
+            ],
+            user_id=user_id,
+            ef_search=ef_search,
+            nprobe=nprobe
+        )
+        
+        latency_ms = int((time.time() - start_time) * 1000)
+        
+        return {
+            "results": [
+                {"memories": memories, "count": len(memories)}
+                for memories in batch_results
+            ],
+            "latency_ms": latency_ms
+        }
+    
     def get_metrics(self) -> Dict[str, Any]:
         """Get current system metrics"""
         total_requests = self.metrics['total_requests']
@@ -169,7 +232,10 @@ class ChatOrchestrator:
                 "avg_latency_ms": 0.0,
                 "avg_memory_retrieval_ms": 0.0,
                 "avg_llm_inference_ms": 0.0,
-                "total_memories_stored": len(self.memory_engine.list_all_memories())
+                "total_memories_stored": self.memory_engine.count_resident_memories(),
+                "embedding_cache": embedding_cache_stats(),
+                "retrieval_cache": self.memory_engine.retrieval_cache.stats(),
+                "extraction_queue": self.extraction_queue.stats()
             }
         
         return {
@@ -188,9 +254,22 @@ class ChatOrchestrator:
                 self.metrics['total_llm_time'] / total_requests * 1000,
                 2
             ),
-            "total_memories_stored": len(self.memory_engine.list_all_memories())
+            "total_memories_stored": self.memory_engine.count_resident_memories(),
+            "embedding_cache": embedding_cache_stats(),
+            "retrieval_cache": self.memory_engine.retrieval_cache.stats(),
+            "extraction_queue": self.extraction_queue.stats()
         }
     
+    def start(self):
+        """Start background extraction, resuming conversations queued before a restart"""
+        self.extraction_queue.start()
+    
+    async def shutdown(self):
+        """Finish queued extractions, close provider connections and flush pending memory writes to disk"""
+        await self.extraction_queue.stop()
+        await self.llm_client.aclose()
+        self.memory_engine.close()
+    
     def health_check(self) -> Dict[str, str]:
         """Check health of all components"""
         return {
@@ -198,3 +277,19 @@ class ChatOrchestrator:
             "llm_client": "healthy" if self.llm_client.is_available() else "unavailable",
             "prompt_builder": "healthy" if self.prompt_builder else "unavailable"
         }
+
+
+def _merge_conversations(conversations):
+    """
+    Join a user's queued conversations into one. Each request carries the
+    client's history plus its new exchange, so consecutive conversations of
+    a session overlap; the part already covered by the previous ones is
+    left out.
+    """
+    merged = []
+    for conversation in conversations:
+        overlap = min(len(merged), len(conversation))
+        while overlap and merged[len(merged) - overlap:] != conversation[:overlap]:
+            overlap -= 1
+        merged.extend(conversation[overlap:])
+    return merged
@@ -45,19 +45,13 @@ Guidelines:
         return system_prompt, user_prompt
     
     def _filter_memories(self, memories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Filter and prioritize memories based on relevance and confidence"""
+        """Limit memories to the most relevant ones"""
         if not memories:
             return []
         
-        # Sort by score (relevance) and confidence
-        sorted_memories = sorted(
-            memories,
-            key=lambda m: (m.get('score', 0), m.get('memory', {}).get('confidence', 0)),
-            reverse=True
-        )
-        
-        # Limit to MAX_MEMORIES
-        return sorted_memories[:self.MAX_MEMORIES]
+        # Already ranked by the memory engine (relevance, confidence,
+        # recency and memory type)
+        return memories[:self.MAX_MEMORIES]
     
     def _format_memory_context(self, memories: List[Dict[str, Any]]) -> str:
         """Format memories into a clean, structured context"""
@@ -2,6 +2,7 @@
 Quick test to verify local mode is working
 Run this before starting the server
 """
+import asyncio
 import sys
 import os
 
@@ -61,7 +62,7 @@ try:
         print("   ✅ LLM Client initialized")
         
         # Test generation
-        response = client.generate("Hello, my name is Sarah")
+        response = asyncio.run(client.generate("Hello, my name is Sarah"))
         print(f"   ✅ Generated response: {response[:50]}...")
     else:
         print("   ❌ LLM Client not available")
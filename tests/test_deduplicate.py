@@ -0,0 +1,13 @@
+from memory_manager.deduplicate import deduplicate_memories, near_duplicate_rows
+
+
+def test_deduplicate_memories_keeps_last_per_key():
+    memories = [{"key": "a", "value": "1"}, {"key": "b", "value": "2"}, {"key": "a", "value": "3"}]
+    assert deduplicate_memories(memories) == memories[1:]
+
+
+def test_near_duplicate_rows_matches_same_type_only():
+    embeddings = [[1.0, 0.0], [0.99, 0.1], [1.0, 0.01], [0.0, 1.0]]
+    types = ["constraint", "constraint", "fact", "constraint"]
+    assert near_duplicate_rows(embeddings, types, 0.95) == [-1, 0, -1, -1]
+    assert near_duplicate_rows(embeddings[:1], types[:1], 0.95) == [-1]
@@ -0,0 +1,51 @@
+import threading
+import numpy as np
+import pytest
+from memory_manager.embedding_batcher import EmbeddingBatcher
+
+
+def test_concurrent_texts_are_encoded_together():
+    calls = []
+    release = threading.Event()
+
+    def encode(texts):
+        calls.append(list(texts))
+        release.wait()
+        return np.array([[len(text), 0.0] for text in texts])
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=50)
+    first = batcher.submit("a")
+    futures = [batcher.submit("b" * i) for i in range(1, 6)]
+    release.set()
+
+    assert first.result(timeout=5).tolist() == [1.0, 0.0]
+    assert [future.result(timeout=5)[0] for future in futures] == [1, 2, 3, 4, 5]
+    assert [len(call) for call in calls] == [4, 2]
+    assert batcher.embed(["xyz"]).dtype == np.float32
+    batcher.stop()
+
+
+def test_encoder_errors_reach_every_caller():
+    def encode(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.embed(["a", "b"])
+    batcher.stop()
+
+
+def test_executor_keeps_several_batches_in_flight():
+    from concurrent.futures import ThreadPoolExecutor
+
+    in_flight = threading.Barrier(2, timeout=5)
+
+    def encode(texts):
+        # Returns only once a second batch is being encoded at the same time
+        in_flight.wait()
+        return np.ones((len(texts), 2))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        batcher = EmbeddingBatcher(encode, max_batch_size=1, max_wait_ms=0, executor=executor)
+        assert batcher.embed(["a", "b"]).shape == (2, 2)
+        batcher.stop()
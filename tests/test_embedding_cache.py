@@ -0,0 +1,27 @@
+import numpy as np
+from memory_manager.embedding_cache import EmbeddingCache
+
+
+def test_lru_tier_counts_hits_and_misses():
+    cache = EmbeddingCache("model-a", capacity=2, path="")
+    cache.put_many(["a", "b"], np.eye(2, dtype="float32"))
+
+    vectors = cache.get_many(["a", "c"])
+    np.testing.assert_array_equal(vectors[0], [1, 0])
+    assert vectors[1] is None
+
+    # "a" was used most recently, so "b" is evicted
+    cache.put_many(["c"], [np.ones(2, dtype="float32")])
+    assert cache.get_many(["b"]) == [None]
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.3333, "size": 2}
+
+
+def test_sqlite_tier_survives_restart_and_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache("model-a", capacity=10, path=path)
+    cache.put_many(["Suggest dinner options"], [np.arange(4, dtype="float32")])
+    cache.close()
+
+    reopened = EmbeddingCache("model-a", capacity=10, path=path)
+    np.testing.assert_array_equal(reopened.get_many(["Suggest dinner options"])[0], np.arange(4))
+    assert EmbeddingCache("model-b", capacity=10, path=path).get_many(["Suggest dinner options"]) == [None]
@@ -0,0 +1,192 @@
+import gc
+import hashlib
+import threading
+import time
+import numpy as np
+import pytest
+from memory_manager import memory_engine
+from memory_manager.memory_engine import KeyIndex, MemoryEngine
+from memory_manager.retention import RetentionPolicy
+
+
+def _bag_of_words(texts):
+    # Deterministic stand-in for the embedding model: shared words, close vectors
+    vectors = np.zeros((len(list(texts)), 384), dtype="float32")
+    for i, text in enumerate(texts):
+        for word in text.lower().replace("|", " ").split():
+            vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 384] += 1.0
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_engine, "generate_embeddings", lambda texts: _bag_of_words(list(texts)))
+    engine = MemoryEngine(shard_dir=str(tmp_path), compaction_interval=0, sweep_interval=0)
+    yield engine
+    engine.close()
+
+
+def _memory(key, value, memory_type="preference", confidence=0.9, action="add"):
+    return {"type": memory_type, "key": key, "value": value, "confidence": confidence, "action": action}
+
+
+def _stored(engine, user_id="alice"):
+    return sorted((m["key"], m["value"]) for m in engine.list_all_memories(user_id))
+
+
+def _key_index(engine, user_id="alice"):
+    """
+    The engine's key index for ``user_id``, checked against one rebuilt
+    from the shard.
+    """
+    store = engine.shards.get(user_id)
+    key_index = engine._key_index(store)
+    rebuilt = KeyIndex(store)
+    assert dict(key_index.by_key) == dict(rebuilt.by_key)
+    assert dict(key_index.by_key_value) == dict(rebuilt.by_key_value)
+    return key_index
+
+
+def _reload(engine, user_id="alice"):
+    # Drop the resident shard so the next access loads it from disk
+    engine.shards.evict(user_id)
+    gc.collect()
+
+
+LONG_VALUE = "loves long spicy thai curries with jasmine rice and extra lime on weekends"
+
+
+def test_near_duplicates_are_scoped_to_the_same_key(engine):
+    engine.store_memories({"memories": [_memory("food_preference", LONG_VALUE)]}, "alice")
+    # As similar, but about a different key: kept
+    engine.store_memories({"memories": [_memory("weekend_plans", LONG_VALUE)]}, "alice")
+    assert _stored(engine) == [("food_preference", LONG_VALUE), ("weekend_plans", LONG_VALUE)]
+
+    # A paraphrase under the same key with higher confidence replaces it
+    paraphrase = LONG_VALUE.replace("loves", "really loves")
+    engine.store_memories({"memories": [_memory("food_preference", paraphrase, confidence=0.95)]}, "alice")
+    assert _stored(engine) == [("food_preference", paraphrase), ("weekend_plans", LONG_VALUE)]
+
+
+def test_changed_values_under_the_same_key_are_kept(engine, monkeypatch):
+    # As similar as a sentence encoder rates texts sharing type and key
+    monkeypatch.setattr(memory_engine, "DUPLICATE_SIMILARITY", 0.5)
+    engine.store_memories({"memories": [
+        _memory("user_age", "29", memory_type="fact"),
+        _memory("scheduled_call", "Friday 3pm", memory_type="commitment")
+    ]}, "alice")
+    engine.store_memories({"memories": [
+        _memory("user_age", "30", memory_type="fact"),
+        _memory("scheduled_call", "Monday 3pm", memory_type="commitment"),
+        _memory("food_preference", LONG_VALUE)
+    ]}, "alice")
+    assert _stored(engine) == [
+        ("food_preference", LONG_VALUE), ("scheduled_call", "Friday 3pm"), ("scheduled_call", "Monday 3pm"),
+        ("user_age", "29"), ("user_age", "30")
+    ]
+
+    # Paraphrases are still merged
+    paraphrase = LONG_VALUE.replace("loves", "really loves")
+    engine.store_memories({"memories": [_memory("food_preference", paraphrase)]}, "alice")
+    assert ("food_preference", paraphrase) not in _stored(engine)
+
+
+def test_type_scope_is_opt_in(engine, monkeypatch):
+    monkeypatch.setattr(memory_engine, "DUPLICATE_SCOPE", "type")
+    engine.store_memories({"memories": [_memory("food_preference", LONG_VALUE)]}, "alice")
+    engine.store_memories({"memories": [_memory("weekend_plans", LONG_VALUE)]}, "alice")
+    assert _stored(engine) == [("food_preference", LONG_VALUE)]
+
+
+def test_key_index_follows_adds_and_updates(engine):
+    engine.store_memories({"memories": [_memory("city", "Tokyo"), _memory("diet", "vegetarian")]}, "alice")
+    # Already known: nothing added
+    engine.store_memories({"memories": [_memory("city", "Tokyo")]}, "alice")
+    key_index = _key_index(engine)
+    assert sorted(key_index.by_key_value) == [("city", "Tokyo"), ("diet", "vegetarian")]
+
+    engine.store_memories({"memories": [_memory("city", "Osaka", action="update")]}, "alice")
+    key_index = _key_index(engine)
+    assert sorted(key_index.by_key_value) == [("city", "Osaka"), ("diet", "vegetarian")]
+    assert len(key_index.by_key["city"]) == 1
+
+    # The replaced value is no longer known, so storing it again adds it
+    engine.store_memories({"memories": [_memory("city", "Tokyo")]}, "alice")
+    assert ("city", "Tokyo") in _key_index(engine).by_key_value
+    assert _stored(engine) == [("city", "Osaka"), ("city", "Tokyo"), ("diet", "vegetarian")]
+
+
+def test_key_index_follows_sweeper_evictions(engine):
+    engine.store_memories({"memories": [_memory("city", "Tokyo")]}, "alice")
+    engine.store_memories({"memories": [_memory("diet", "vegetarian")]}, "alice")
+    engine._sweeper.policy = RetentionPolicy(ttl_days={}, max_memories=1)
+    assert engine._sweeper.sweep_all() == 1
+
+    key_index = _key_index(engine)
+    assert list(key_index.by_key_value) == [("diet", "vegetarian")]
+    # An evicted memory can be stored again
+    engine._sweeper.policy = RetentionPolicy(ttl_days={}, max_memories=0)
+    engine.store_memories({"memories": [_memory("city", "Tokyo")]}, "alice")
+    assert sorted(_key_index(engine).by_key) == ["city", "diet"]
+
+
+def test_key_index_follows_near_duplicate_replacement(engine):
+    engine.store_memories({"memories": [_memory("food_preference", LONG_VALUE)]}, "alice")
+    paraphrase = LONG_VALUE.replace("loves", "really loves")
+    engine.store_memories({"memories": [_memory("food_preference", paraphrase, confidence=0.95)]}, "alice")
+
+    key_index = _key_index(engine)
+    assert list(key_index.by_key_value) == [("food_preference", paraphrase)]
+    assert len(key_index.by_key["food_preference"]) == 1
+
+
+def test_key_index_is_rebuilt_on_reload(engine):
+    engine.store_memories({"memories": [_memory("city", "Tokyo"), _memory("diet", "vegetarian")]}, "alice")
+    engine.shards.get("alice").save_index()
+    # Only in the write-ahead log
+    engine.store_memories({"memories": [_memory("city", "Osaka", action="update")]}, "alice")
+    engine.store_memories({"memories": [_memory("pet", "cat")]}, "alice")
+    before = {key: len(ids) for key, ids in _key_index(engine).by_key_value.items()}
+
+    _reload(engine)
+    key_index = _key_index(engine)
+    assert {key: len(ids) for key, ids in key_index.by_key_value.items()} == before
+    assert sorted(key_index.by_key_value) == [("city", "Osaka"), ("diet", "vegetarian"), ("pet", "cat")]
+
+    # Writes after the reload keep it consistent
+    engine.store_memories({"memories": [_memory("diet", "vegan", action="update")]}, "alice")
+    assert sorted(_key_index(engine).by_key_value) == [("city", "Osaka"), ("diet", "vegan"), ("pet", "cat")]
+
+
+def test_embedding_runs_outside_the_shard_lock(engine, monkeypatch):
+    calls = []
+
+    def embed_during_other_write(texts):
+        texts = list(texts)
+        calls.append(texts)
+        if len(calls) == 1:
+            # Another writer gets the shard lock while this write is embedding
+            other = threading.Thread(
+                target=engine.store_memories, args=({"memories": [_memory("city", "Tokyo")]}, "alice")
+            )
+            other.start()
+            other.join(timeout=5)
+            assert not other.is_alive()
+        return _bag_of_words(texts)
+
+    monkeypatch.setattr(memory_engine, "generate_embeddings", embed_during_other_write)
+    engine.store_memories({"memories": [_memory("city", "Tokyo"), _memory("diet", "vegan")]}, "alice")
+
+    # The memory stored in the meantime is not added twice
+    assert _stored(engine) == [("city", "Tokyo"), ("diet", "vegan")]
+    _key_index(engine)
+
+
+def test_cached_results_drop_memories_that_expire(engine):
+    commitment = _memory("dentist_call", "friday", memory_type="commitment")
+    engine.store_memories({"memories": [dict(commitment, expires_at=time.time() + 0.2)]}, "alice")
+    query = "commitment dentist_call friday"
+    assert [m["memory"]["key"] for m in engine.retrieve_memories(query, user_id="alice")] == ["dentist_call"]
+
+    time.sleep(0.25)
+    assert engine.retrieve_memories(query, user_id="alice") == []
@@ -0,0 +1,110 @@
+import asyncio
+import os
+from orchestrator.services.extraction_queue import ExtractionQueue
+
+
+def _conversation(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_pending_conversations_of_a_user_are_coalesced(tmp_path):
+    calls = []
+
+    async def handler(user_id, conversations):
+        calls.append((user_id, [c[0]["content"] for c in conversations]))
+        await asyncio.sleep(0.05)
+
+    async def run():
+        queue = ExtractionQueue(handler, path=str(tmp_path), workers=2, max_batch=2)
+        queue.enqueue("alice", _conversation("a1"))
+        await asyncio.sleep(0.01)
+        # Queued while a1 is being extracted
+        for text in ("a2", "a3", "a4"):
+            queue.enqueue("alice", _conversation(text))
+        queue.enqueue("bob", _conversation("b1"))
+        assert queue.stats()["depth"] == 4 and queue.stats()["in_flight"] == 1
+        await queue.stop(timeout=5)
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert calls == [("alice", ["a1"]), ("bob", ["b1"]), ("alice", ["a2", "a3"]), ("alice", ["a4"])]
+    assert stats["processed"] == 5 and stats["batches"] == 4 and stats["depth"] == 0
+    # Nothing left spooled
+    assert os.listdir(tmp_path) == []
+
+
+def test_unfinished_conversations_survive_a_restart(tmp_path):
+    stored = []
+
+    async def stuck(user_id, conversations):
+        await asyncio.sleep(10)
+
+    async def store(user_id, conversations):
+        stored.append((user_id, len(conversations)))
+
+    async def first_run():
+        queue = ExtractionQueue(stuck, path=str(tmp_path), workers=1)
+        queue.enqueue("alice", _conversation("I live in Tokyo"))
+        queue.enqueue("alice", _conversation("I'm vegetarian"))
+        await asyncio.sleep(0.01)
+        await queue.stop(timeout=0)
+
+    async def second_run():
+        queue = ExtractionQueue(store, path=str(tmp_path), workers=1)
+        queue.start()
+        assert queue.stats()["depth"] == 2
+        await queue.stop(timeout=5)
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+    assert stored == [("alice", 2)]
+
+
+def test_failed_extraction_is_set_aside(tmp_path):
+    async def fail(user_id, conversations):
+        raise ValueError("no JSON in response")
+
+    async def run():
+        queue = ExtractionQueue(fail, path=str(tmp_path), workers=1, max_attempts=2, retry_backoff=0.01)
+        queue.enqueue("alice", _conversation("hello"))
+        await queue.stop(timeout=5)
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.stats()["failed"] == 1 and queue.stats()["retried"] == 1
+    [spool] = os.listdir(tmp_path)
+    assert [name for name in os.listdir(tmp_path / spool) if name.endswith(".failed")]
+
+
+def test_failed_extraction_is_retried_before_newer_conversations(tmp_path):
+    calls = []
+
+    async def flaky(user_id, conversations):
+        calls.append([c[0]["content"] for c in conversations])
+        if len(calls) == 1:
+            raise TimeoutError()
+
+    async def run():
+        queue = ExtractionQueue(flaky, path=str(tmp_path), workers=2, max_batch=1, retry_backoff=0.05)
+        queue.enqueue("alice", _conversation("a1"))
+        await asyncio.sleep(0.01)
+        queue.enqueue("alice", _conversation("a2"))
+        await asyncio.sleep(0.01)
+        # a2 waits for the retry of a1
+        assert queue.stats()["retrying"] == 1 and queue.stats()["depth"] == 1
+        await queue.stop(timeout=5)
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert calls == [["a1"], ["a1"], ["a2"]]
+    assert stats["processed"] == 2 and stats["failed"] == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_overlapping_conversations_are_merged():
+    from orchestrator.services.orchestrator import _merge_conversations
+
+    hello, hi, where, tokyo = (_conversation(text)[0] for text in ("hello", "hi", "where?", "Tokyo"))
+    # Each request carries the history so far plus its new exchange
+    merged = _merge_conversations([[hello, hi], [hello, hi, where, tokyo], [where, tokyo, hello]])
+    assert merged == [hello, hi, where, tokyo, hello]
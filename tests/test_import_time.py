@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+# Generous for slow CI machines; loading the embedding model takes seconds
+IMPORT_BUDGET_SECONDS = 2.0
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import memory_manager.memory_engine
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "elapsed": elapsed,
+    "loaded": sorted(m for m in ("torch", "sentence_transformers") if m in sys.modules)
+}))
+"""
+
+
+def test_memory_engine_imports_without_loading_the_model():
+    # A fresh interpreter, so modules imported by other tests do not count
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,27 @@
+from memory_manager.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_splits_keys_and_drops_stopwords():
+    assert tokenize("dietary_restriction") == ["dietary", "restriction"]
+    assert tokenize("Where do I live, Tokyo?") == ["live", "tokyo"]
+
+
+def test_bm25_ranks_and_reports_coverage():
+    index = LexicalIndex()
+    index.add(0, "user_name", "Sarah")
+    index.add(1, "dietary_restriction", "no peanuts")
+    index.add(2, "food_preference", "peanuts and dietary fibre")
+
+    hits = index.search("dietary restriction")
+    assert [memory_id for memory_id, _, _ in hits] == [1, 2]
+    assert hits[0][2] == 1.0 and hits[1][2] == 0.5
+
+    index.remove(1)
+    assert [memory_id for memory_id, _, _ in index.search("dietary restriction")] == [2]
+    assert index.search("Sarah")[0][0] == 0
+    assert index.search("the") == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2]])
+    assert [item_id for item_id, _ in fused] == [2, 1, 3]
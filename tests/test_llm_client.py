@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+from orchestrator.services.llm_client import LLMClient
+
+
+def _client(openai_create):
+    client = LLMClient.__new__(LLMClient)
+    client.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=openai_create)))
+    client.gemini_client = None
+    client.ollama_url = None
+    client.use_local_fallback = True
+    client.provider_timeout = 0.05
+    client._http_client = None
+    return client
+
+
+def test_slow_provider_falls_through_without_blocking():
+    async def hang(**kwargs):
+        await asyncio.sleep(10)
+
+    async def run():
+        client = _client(hang)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        response = await client.generate("Hi, I'm Sarah")
+        task.cancel()
+        return response, ticks
+
+    response, ticks = asyncio.run(run())
+    assert response.startswith("Hello Sarah!")
+    # The event loop kept running while the provider was pending
+    assert ticks > 5
+
+
+def test_provider_response_is_returned():
+    async def answer(**kwargs):
+        assert kwargs["messages"][0] == {"role": "system", "content": "Be brief"}
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Hi"))])
+
+    assert asyncio.run(_client(answer).generate("Hello", system_prompt="Be brief")) == "Hi"
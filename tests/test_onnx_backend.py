@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+from memory_manager.onnx_backend import (
+    CONFIG_FILE, PARITY_MIN_COSINE, PARITY_TEXTS, OnnxEmbedder, model_dir, parity_check
+)
+
+
+def test_parity_check_reports_row_cosines():
+    reference = np.array([[1.0, 0.0], [0.0, 2.0]])
+    candidate = np.array([[1.0, 0.0], [1.0, 1.0]])
+    parity = parity_check(reference, candidate)
+    assert parity["min_cosine"] == pytest.approx(np.sqrt(0.5))
+    assert parity["mean_cosine"] == pytest.approx((1 + np.sqrt(0.5)) / 2)
+
+
+def test_exports_are_kept_apart_by_precision(tmp_path):
+    assert model_dir("sentence-transformers/all-MiniLM-L6-v2", True, str(tmp_path)) != \
+        model_dir("sentence-transformers/all-MiniLM-L6-v2", False, str(tmp_path))
+
+
+def _tiny_sentence_transformer(path):
+    """
+    A small randomly initialised BERT with mean pooling, saved like a
+    sentence-transformers model, so the export runs offline.
+    """
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    words = sorted({word for text in PARITY_TEXTS for word in text.lower().replace("|", " ").split()})
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words), encoding="utf-8")
+
+    transformer_dir = path / "transformer"
+    BertTokenizerFast(vocab_file=str(vocab_file)).save_pretrained(transformer_dir)
+    config = BertConfig(
+        vocab_size=len(words) + 5, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=64
+    )
+    BertModel(config).save_pretrained(transformer_dir)
+
+    transformer = models.Transformer(str(transformer_dir), max_seq_length=32)
+    model = SentenceTransformer(modules=[transformer, models.Pooling(32, "mean"), models.Normalize()])
+    model_path = path / "model"
+    model.save(str(model_path))
+    return str(model_path)
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_export_load_and_encode(tmp_path, quantize):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxscript")
+    pytest.importorskip("torch")
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+
+    model_path = _tiny_sentence_transformer(tmp_path)
+    onnx_dir = str(tmp_path / "onnx")
+    embedder = OnnxEmbedder.load(model_path, quantize=quantize, onnx_dir=onnx_dir)
+    assert os.path.exists(os.path.join(model_dir(model_path, quantize, onnx_dir), CONFIG_FILE))
+
+    texts = list(PARITY_TEXTS)
+    embeddings = embedder.encode(texts)
+    assert embeddings.shape == (len(texts), embedder.get_sentence_embedding_dimension())
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-5)
+    # Alone, without padding
+    assert np.allclose(embedder.encode(texts[0]), embeddings[0], atol=1e-3)
+
+    reference = sentence_transformers.SentenceTransformer(model_path, device="cpu").encode(texts)
+    assert parity_check(reference, embeddings)["min_cosine"] >= PARITY_MIN_COSINE
@@ -0,0 +1,26 @@
+import numpy as np
+from memory_manager.reranker import Reranker, parse_type_map, SECONDS_PER_DAY
+
+
+def test_parse_type_map():
+    assert parse_type_map("constraint=0.1, commitment=0.05") == {"constraint": 0.1, "commitment": 0.05}
+    assert parse_type_map("") == {}
+
+
+def test_score_blends_priors():
+    reranker = Reranker(similarity_weight=1.0, confidence_weight=0.5, recency_weight=0.2,
+                        half_life_days=10, type_boosts={"constraint": 0.1})
+    now = 100 * SECONDS_PER_DAY
+    boosts = reranker.type_boost_table(["fact", "constraint"])
+    type_codes = np.array([0, 1, -1])
+
+    scores = reranker.score(
+        np.array([0.5, 0.5, 0.5]),
+        np.array([1.0, np.nan, 0.0]),
+        np.array([now, now - 10 * SECONDS_PER_DAY, np.nan]),
+        boosts[type_codes],
+        now=now
+    )
+    # Missing confidence counts as 0, a missing timestamp as old, and the
+    # missing type code as no boost
+    np.testing.assert_allclose(scores, [0.5 + 0.5 + 0.2, 0.5 + 0.1 + 0.1, 0.5])
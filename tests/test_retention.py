@@ -0,0 +1,59 @@
+import numpy as np
+from memory_manager.memory_table import MemoryTable
+from memory_manager.retention import RetentionPolicy, MemorySweeper
+
+
+def _table(memories):
+    table = MemoryTable(dim=2)
+    for memory_id, memory in enumerate(memories):
+        table.append(memory_id, memory, np.zeros(2, dtype="float32"))
+    return table
+
+
+def test_expired_memories_go_first():
+    policy = RetentionPolicy(ttl_days={"commitment": 1}, max_memories=0)
+    assert policy.expires_at("commitment", 0.0) == 86400.0
+    assert policy.expires_at("fact", 0.0) is None
+
+    table = _table([
+        {"type": "fact", "created_at": 0.0},
+        {"type": "commitment", "created_at": 0.0, "expires_at": 86400.0},
+        {"type": "commitment", "created_at": 0.0, "expires_at": 3 * 86400.0}
+    ])
+    assert policy.victims(table, now=2 * 86400.0).tolist() == [1]
+
+
+def test_capacity_evicts_by_policy():
+    table = _table([
+        {"type": "fact", "confidence": 0.9, "created_at": 1.0},
+        {"type": "fact", "confidence": 0.5, "created_at": 2.0},
+        {"type": "fact", "confidence": 0.7, "created_at": 3.0}
+    ])
+    table.touch([0], now=10.0)
+
+    lru = RetentionPolicy(ttl_days={}, max_memories=2, eviction_policy="lru")
+    assert lru.victims(table).tolist() == [1]
+    assert lru.victims(table, limit=0).tolist() == []
+
+    lowest_confidence = RetentionPolicy(ttl_days={}, max_memories=1, eviction_policy="confidence")
+    assert lowest_confidence.victims(table).tolist() == [1, 2]
+
+
+def test_sweeper_removes_in_batches():
+    table = _table([{"type": "fact", "created_at": float(i)} for i in range(5)])
+
+    class Store:
+        pass
+
+    store = Store()
+    store.table = table
+
+    def evict(store, memory_ids):
+        for memory_id in memory_ids:
+            store.table.delete(memory_id)
+        return len(memory_ids)
+
+    sweeper = MemorySweeper(lambda: [store], evict, RetentionPolicy(ttl_days={}, max_memories=1), batch=3)
+    assert sweeper.sweep_all() == 3
+    assert sweeper.sweep_all() == 1
+    assert table.live_ids().tolist() == [4]
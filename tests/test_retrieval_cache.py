@@ -0,0 +1,35 @@
+from memory_manager.retrieval_cache import RetrievalCache
+
+
+def _results(value):
+    return [{"id": 0, "memory": {"key": "user_name", "value": value}, "score": 0.5}]
+
+
+def test_entries_from_an_older_version_are_misses():
+    cache = RetrievalCache(capacity=10)
+    key = ("alice", "What is my name?", 5, None, None, None)
+    cache.put(key, 1, _results("Sarah"))
+
+    assert cache.get(key, 1) == _results("Sarah")
+    assert cache.get(key, 2) is None
+    # The stale entry is dropped rather than kept around
+    assert cache.get(key, 1) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.3333, "size": 0}
+
+
+def test_lru_eviction_and_copies():
+    cache = RetrievalCache(capacity=2)
+    cache.put("a", 1, _results("a"))
+    cache.put("b", 1, _results("b"))
+    cache.get("a", 1)[0]["score"] = 9.0
+    cache.put("c", 1, _results("c"))
+
+    # "a" was used most recently, so "b" is evicted; callers' edits stay out
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1)[0]["score"] == 0.5
+
+
+def test_zero_capacity_disables_caching():
+    cache = RetrievalCache(capacity=0)
+    cache.put("a", 1, _results("a"))
+    assert cache.get("a", 1) is None
@@ -0,0 +1,27 @@
+from memory_manager.serving import WriterLock, WriteInbox
+
+
+def test_only_one_writer_lock_holder(tmp_path):
+    first = WriterLock(str(tmp_path / "writer.lock"))
+    second = WriterLock(str(tmp_path / "writer.lock"))
+
+    assert first.acquire()
+    assert not second.acquire()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_inbox_drains_in_submission_order(tmp_path):
+    inbox = WriteInbox(str(tmp_path / "inbox"))
+    inbox.submit("alice", {"memories": [{"key": "user_name"}]})
+    inbox.submit("bob", {"memories": [{"key": "location"}]})
+
+    handled = []
+    assert inbox.drain(lambda user_id, memory_json: handled.append((user_id, memory_json))) == 2
+    assert handled == [
+        ("alice", {"memories": [{"key": "user_name"}]}),
+        ("bob", {"memories": [{"key": "location"}]})
+    ]
+    assert inbox.drain(handled.append) == 0
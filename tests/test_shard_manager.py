@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from memory_manager.shard_manager import ShardManager, DEFAULT_INDEX_PATH
+
+
+DIM = 8
+
+
+def _memory(key, value):
+    return {"type": "fact", "key": key, "value": value, "confidence": 0.9, "action": "add"}
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).random(DIM).astype("float32").tolist()
+
+
+def _values(store):
+    return sorted(metadata["value"] for _, metadata in store.iter_metadata())
+
+
+def test_evicted_shard_still_in_use_is_not_loaded_twice(tmp_path):
+    shards = ShardManager(shard_dir=str(tmp_path), max_resident_shards=1, dim=DIM, compaction_interval=0)
+    alice = shards.get("alice")
+    shards.get("bob")
+    reloaded = shards.get("alice")
+    assert reloaded is alice
+
+    alice.add(_memory("user_name", "Sarah"), _vector(1))
+    alice.commit()
+    reloaded.add(_memory("location", "Tokyo"), _vector(2))
+    reloaded.commit()
+    shards.close()
+
+    reopened = ShardManager(shard_dir=str(tmp_path), dim=DIM, compaction_interval=0)
+    assert _values(reopened.get("alice")) == ["Sarah", "Tokyo"]
+
+
+def test_user_ids_cannot_escape_or_share_shards(tmp_path):
+    shard_dir = tmp_path / "shards"
+    shards = ShardManager(shard_dir=str(shard_dir), dim=DIM, compaction_interval=0)
+    paths = {user_id: shards.shard_path(user_id) for user_id in (".", "..", "../x", "a/b", "a%2Fb")}
+
+    assert len(set(paths.values())) == len(paths)
+    for path in paths.values():
+        assert os.path.dirname(path) == str(shard_dir)
+        assert os.path.basename(path) not in (".", "..")
+    with pytest.raises(ValueError):
+        shards.shard_path("")
+
+    shards.get("..").add(_memory("user_name", "Sarah"), _vector(1))
+    shards.get(".").add(_memory("user_name", "Sam"), _vector(2))
+    assert _values(shards.get("..")) == ["Sarah"]
+    assert _values(shards.get(".")) == ["Sam"]
+    assert _values(shards.get("alice")) == []
+
+
+def test_client_user_ids_never_reach_the_default_namespace(tmp_path):
+    shard_dir = tmp_path / "shards"
+    shards = ShardManager(shard_dir=str(shard_dir), dim=DIM, compaction_interval=0)
+    # The legacy store, which held every user's memories before sharding
+    assert shards.shard_path(None) == DEFAULT_INDEX_PATH
+    for user_id in ("default", "None", "faiss_index"):
+        assert os.path.dirname(shards.shard_path(user_id)) == str(shard_dir)
@@ -0,0 +1,472 @@
+import pickle
+import threading
+import time
+import pytest
+import numpy as np
+from memory_manager import vector_store
+from memory_manager.reranker import Reranker
+from memory_manager.vector_store import VectorStore
+
+
+DIM = 8
+
+
+def _memory(key, value, memory_type="fact"):
+    return {
+        "type": memory_type,
+        "key": key,
+        "value": value,
+        "confidence": 0.9,
+        "action": "add"
+    }
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).random(DIM).astype("float32").tolist()
+
+
+def test_incremental_add_and_remove(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+
+    first = store.add(_memory("user_name", "Sarah"), _vector(1))
+    second = store.add(_memory("location", "Tokyo"), _vector(2))
+    assert (first, second) == (0, 1)
+    assert len(store) == 2
+
+    store.remove_ids([first])
+    assert len(store) == 1
+
+    results = store.search(_vector(1), top_k=5)
+    assert [r["memory"]["key"] for r in results] == ["location"]
+
+    # IDs are never reused after a removal
+    assert store.add(_memory("user_name", "Sarah Johnson"), _vector(3)) == 2
+
+
+def test_ids_survive_save_and_load(tmp_path):
+    index_path = str(tmp_path / "index")
+    store = VectorStore(dim=DIM, index_path=index_path)
+    store.add(_memory("user_name", "Sarah"), _vector(1))
+    kept = store.add(_memory("location", "Tokyo"), _vector(2))
+    store.remove_ids([0])
+    store.save_index()
+
+    reloaded = VectorStore(dim=DIM, index_path=index_path)
+    assert [memory_id for memory_id, _ in reloaded.iter_metadata()] == [kept]
+    assert reloaded.next_id == 2
+    assert reloaded.search(_vector(2), top_k=1)[0]["memory"]["value"] == "Tokyo"
+
+
+def test_auto_switches_to_ann_past_threshold(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"),
+                        index_type="auto", ann_index_type="hnsw", ann_threshold=10)
+
+    for i in range(9):
+        store.add(_memory(f"key_{i}", str(i)), _vector(i))
+    assert store.index_kind == "flat"
+
+    store.add(_memory("key_9", "9"), _vector(9))
+    assert store.index_kind == "hnsw"
+    assert store.index.ntotal == 10
+
+    # HNSW cannot delete in place; removed IDs must still never be returned
+    store.remove_ids([3])
+    keys = [r["memory"]["key"] for r in store.search(_vector(3), top_k=10, ef_search=32)]
+    assert "key_3" not in keys
+    assert len(keys) == 9
+
+
+def test_save_appends_only_new_rows(tmp_path):
+    index_path = str(tmp_path / "index")
+    store = VectorStore(dim=DIM, index_path=index_path)
+    store.add(_memory("user_name", "Sarah"), _vector(1))
+    store.save_index()
+    vectors_size = (tmp_path / "index" / "vectors.f32").stat().st_size
+
+    store.add(_memory("location", "Tokyo"), _vector(2))
+    store.save_index()
+    assert (tmp_path / "index" / "vectors.f32").stat().st_size == 2 * vectors_size
+
+    reloaded = VectorStore(dim=DIM, index_path=index_path)
+    assert isinstance(reloaded.table.base_vectors, np.memmap)
+    assert reloaded.search(_vector(2), top_k=1)[0]["memory"]["value"] == "Tokyo"
+
+
+def test_interrupted_compaction_keeps_committed_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "COMPACTION_MIN_ROWS", 1)
+    index_path = str(tmp_path / "index")
+    writer = VectorStore(dim=DIM, index_path=index_path)
+    for i in range(4):
+        writer.add(_memory(f"key_{i}", str(i)), _vector(i))
+    writer.save_index()
+    writer.remove_ids([0, 1, 2])
+    writer.commit()
+
+    def crash(self):
+        raise OSError("crashed before the manifest was written")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(VectorStore, "_write_manifest", crash)
+        with pytest.raises(OSError):
+            writer.save_index()
+
+    # The old manifest still names the old files, which are untouched
+    for read_only in (False, True):
+        reopened = VectorStore(dim=DIM, index_path=index_path, read_only=read_only)
+        assert [m["value"] for _, m in reopened.iter_metadata()] == ["3"]
+
+    follower = VectorStore(dim=DIM, index_path=index_path, read_only=True)
+    compacted = VectorStore(dim=DIM, index_path=index_path)
+    compacted.save_index()
+    files = sorted(path.name for path in (tmp_path / "index").iterdir())
+    assert "vectors.f32" not in files and "ids.i64" not in files
+    follower.refresh()
+    assert [m["value"] for _, m in follower.iter_metadata()] == ["3"]
+    assert [m["value"] for _, m in VectorStore(dim=DIM, index_path=index_path).iter_metadata()] == ["3"]
+
+
+def test_imports_legacy_pickle(tmp_path):
+    legacy = [{"metadata": _memory("user_name", "Sarah"), "embedding": _vector(1)}]
+    with open(tmp_path / "index.pkl", "wb") as f:
+        pickle.dump((legacy,), f)
+
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    assert store.next_id == 1
+    assert (tmp_path / "index" / "manifest.json").exists()
+    assert store.search(_vector(1), top_k=1)[0]["memory"]["value"] == "Sarah"
+
+
+def test_committed_writes_survive_without_snapshot(tmp_path):
+    index_path = str(tmp_path / "index")
+    store = VectorStore(dim=DIM, index_path=index_path)
+    store.add(_memory("user_name", "Sarah"), _vector(1))
+    store.save_index()
+
+    # Logged but never folded into the snapshot, as after a crash
+    store.add(_memory("location", "Tokyo"), _vector(2))
+    store.remove_ids([0])
+    store.commit()
+
+    recovered = VectorStore(dim=DIM, index_path=index_path)
+    assert [m["value"] for _, m in recovered.iter_metadata()] == ["Tokyo"]
+    assert recovered.wal.record_count == 2
+
+    recovered.save_index()
+    assert recovered.wal.record_count == 0
+    assert len(VectorStore(dim=DIM, index_path=index_path)) == 1
+
+
+def test_type_filter_returns_full_top_k(tmp_path):
+    for index_type in ("flat", "hnsw"):
+        store = VectorStore(dim=DIM, index_path=str(tmp_path / index_type), index_type=index_type)
+        for i in range(50):
+            store.add(_memory(f"fact_{i}", str(i)), _vector(i))
+        for i in range(3):
+            store.add(_memory(f"constraint_{i}", str(i), memory_type="constraint"), _vector(100 + i))
+        store.remove_ids([50])
+
+        results = store.search(_vector(0), top_k=5, memory_type="constraint")
+        assert sorted(r["memory"]["key"] for r in results) == ["constraint_1", "constraint_2"]
+        assert len(store.search(_vector(0), top_k=5, memory_type="fact")) == 5
+        assert store.search(_vector(0), top_k=5, memory_type="commitment") == []
+
+
+def test_type_selector_is_not_cached_across_a_concurrent_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "DELTA_MERGE_ROWS", 1)
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    store.add(_memory("diet", "vegetarian", memory_type="constraint"), _vector(1))
+    writer = threading.Thread(
+        target=store.add, args=(_memory("allergy", "peanuts", memory_type="constraint"), _vector(2))
+    )
+
+    type_ids = store.table.type_ids
+
+    def type_ids_during_write(memory_type):
+        memory_ids = type_ids(memory_type)
+        if writer.ident is None:
+            # A write of the same type lands while the selector is being built
+            writer.start()
+            writer.join(timeout=0.2)
+        return memory_ids
+
+    monkeypatch.setattr(store.table, "type_ids", type_ids_during_write)
+    store.search(_vector(1), top_k=5, memory_type="constraint")
+    writer.join()
+
+    results = store.search(_vector(2), top_k=5, memory_type="constraint")
+    assert sorted(r["memory"]["key"] for r in results) == ["allergy", "diet"]
+
+
+def test_type_filtered_search_does_not_wait_on_writers(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    store.add(_memory("diet", "vegetarian", memory_type="constraint"), _vector(1))
+    results = []
+    searcher = threading.Thread(
+        target=lambda: results.append(store.search(_vector(1), top_k=5, memory_type="constraint"))
+    )
+
+    # As held by a writer for a whole batch
+    with store.lock:
+        searcher.start()
+        searcher.join(timeout=5)
+        assert [r["memory"]["key"] for r in results[0]] == ["diet"]
+
+
+def test_expired_memories_are_not_returned_before_the_sweep(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    for i in range(6):
+        store.add(_memory(f"fact_{i}", f"value {i}"), _vector(i))
+    expired = dict(_memory("call", "dentist friday", memory_type="commitment"), expires_at=time.time() - 1)
+    store.add(expired, _vector(0))
+    store.add(_memory("gym", "monday", memory_type="commitment"), _vector(1))
+    store.add(_memory("dinner", "saturday", memory_type="commitment"), _vector(2))
+
+    for memory_type in (None, "commitment"):
+        keys = [r["memory"]["key"] for r in store.search(_vector(0), top_k=2, memory_type=memory_type)]
+        assert "call" not in keys and len(keys) == 2
+    assert store.lexical_search("dentist friday") == []
+    # Not removed, only hidden
+    assert len(store) == 9
+
+
+def test_ivf_deletes_keep_ids_in_step(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.random((5000, DIM)).astype("float32")
+    removal_order = rng.permutation(5000).tolist()
+    for index_type, precision in (("ivf", "float32"), ("ivf", "float16"), ("ivfpq", "float32")):
+        index_path = str(tmp_path / f"{index_type}-{precision}")
+        store = VectorStore(dim=DIM, index_path=index_path, index_type=index_type, precision=precision)
+        store.add_batch([_memory(f"key_{i}", str(i)) for i in range(5000)], vectors)
+
+        # Each round masks enough IDs to be merged out of the index
+        for removed in (removal_order[:1100], removal_order[1100:2200]):
+            store.remove_ids(removed)
+            live = removal_order[2200:2300]
+            results = store.search_batch(vectors[live], top_k=1, nprobe=1024)
+            assert [r[0]["memory"]["key"] for r in results] == [f"key_{i}" for i in live]
+
+        store.save_index()
+        reloaded = VectorStore(dim=DIM, index_path=index_path, index_type=index_type, precision=precision)
+        results = reloaded.search_batch(vectors[live], top_k=1, nprobe=1024)
+        assert [r[0]["memory"]["key"] for r in results] == [f"key_{i}" for i in live]
+
+
+def test_reduced_precision_reranks_to_exact_order(tmp_path):
+    exact = VectorStore(dim=DIM, index_path=str(tmp_path / "exact"))
+    for precision in ("float16", "int8"):
+        store = VectorStore(dim=DIM, index_path=str(tmp_path / precision), precision=precision)
+        for i in range(30):
+            store.add(_memory(f"key_{i}", str(i)), _vector(i))
+            if precision == "float16":
+                exact.add(_memory(f"key_{i}", str(i)), _vector(i))
+        store.save_index()
+
+        reloaded = VectorStore(dim=DIM, index_path=str(tmp_path / precision), precision=precision)
+        assert reloaded.index_precision == precision
+        for store in (store, reloaded):
+            assert store.search(_vector(7), top_k=5) == exact.search(_vector(7), top_k=5)
+
+
+def test_search_batch_matches_single_queries(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    for i in range(20):
+        store.add(_memory(f"key_{i}", str(i), "fact" if i % 2 else "constraint"), _vector(i))
+
+    queries = [_vector(100), _vector(101), _vector(102)]
+    top_ks = [3, 1, 5]
+    memory_types = [None, "fact", "constraint"]
+
+    batch = store.search_batch(np.array(queries), top_ks, memory_types=memory_types)
+    for query, top_k, memory_type, results in zip(queries, top_ks, memory_types, batch):
+        assert results == store.search(query, top_k=top_k, memory_type=memory_type)
+
+
+def test_table_rows_match_vector_file(tmp_path):
+    index_path = str(tmp_path / "index")
+    store = VectorStore(dim=DIM, index_path=index_path)
+    for i in range(4):
+        store.add(_memory(f"key_{i}", str(i), "fact" if i % 2 else "constraint"), _vector(i))
+    store.save_index()
+
+    # A row deleted before it is saved is written without metadata
+    store.add(_memory("key_4", "4"), _vector(4))
+    store.remove_ids([1, 4])
+    store.save_index()
+
+    reloaded = VectorStore(dim=DIM, index_path=index_path)
+    assert reloaded.table.n_rows == 5
+    assert [memory_id for memory_id, _ in reloaded.iter_metadata()] == [0, 2, 3]
+    assert reloaded.get_metadata(3) == _memory("key_3", "3", "fact")
+    assert reloaded.table.type_count("constraint") == 2
+    np.testing.assert_array_equal(reloaded.table.vectors([2]), [_vector(2)])
+
+
+def test_published_versions_are_never_modified(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "DELTA_MERGE_ROWS", 10)
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    for i in range(10):
+        store.add(_memory(f"key_{i}", str(i)), _vector(i))
+
+    # A reader holding this version keeps searching the same index
+    version = store.version
+    assert version.index.ntotal == 10
+
+    store.add(_memory("key_10", "10"), _vector(10))
+    store.remove_ids([0])
+    assert store.version is version
+    assert version.index.ntotal == 10
+
+    # Unmerged rows are searched exactly and masked IDs are skipped
+    keys = [r["memory"]["key"] for r in store.search(_vector(10), top_k=11)]
+    assert keys[0] == "key_10" and len(keys) == 10 and "key_0" not in keys
+
+    for i in range(11, 20):
+        store.add(_memory(f"key_{i}", str(i)), _vector(i))
+    assert store.version.number > version.number
+    assert version.index.ntotal == 10
+    assert store.version.index.ntotal == 19
+
+
+def test_read_only_store_follows_writer(tmp_path):
+    index_path = str(tmp_path / "index")
+    writer = VectorStore(dim=DIM, index_path=index_path)
+    writer.add(_memory("user_name", "Sarah"), _vector(1))
+    writer.commit()
+
+    reader = VectorStore(dim=DIM, index_path=index_path, read_only=True)
+    assert [m["value"] for _, m in reader.iter_metadata()] == ["Sarah"]
+
+    writer.add(_memory("location", "Tokyo"), _vector(2))
+    writer.commit()
+    reader.refresh()
+    assert reader.search(_vector(2), top_k=1)[0]["memory"]["value"] == "Tokyo"
+
+    # Writes folded into a snapshot before the reader saw them
+    writer.remove_ids([0])
+    writer.add(_memory("pet", "cat"), _vector(3))
+    writer.commit()
+    writer.save_index()
+    writer.add(_memory("job", "nurse"), _vector(4))
+    writer.commit()
+    reader.refresh()
+    assert [m["value"] for _, m in reader.iter_metadata()] == ["Tokyo", "cat", "nurse"]
+
+    with pytest.raises(RuntimeError):
+        reader.add(_memory("user_name", "Sam"), _vector(5))
+
+
+def test_read_only_store_catches_up_after_two_snapshots(tmp_path):
+    index_path = str(tmp_path / "index")
+    writer = VectorStore(dim=DIM, index_path=index_path)
+    writer.add(_memory("user_name", "Sarah"), _vector(1))
+    writer.commit()
+    reader = VectorStore(dim=DIM, index_path=index_path, read_only=True)
+    writer.add(_memory("location", "Tokyo"), _vector(2))
+    writer.commit()
+    # The reader is part way through this log generation
+    reader.refresh()
+
+    writer.add(_memory("pet", "cat"), _vector(3))
+    writer.commit()
+    writer.save_index()
+    # A whole generation the reader never opens
+    writer.remove_ids([0])
+    writer.add(_memory("job", "nurse"), _vector(4))
+    writer.commit()
+    writer.save_index()
+    writer.add(_memory("diet", "vegan"), _vector(5))
+    writer.commit()
+
+    reader.refresh()
+    assert [m["value"] for _, m in reader.iter_metadata()] == ["Tokyo", "cat", "nurse", "vegan"]
+
+
+def test_lexical_search_follows_writes_and_type_filter(tmp_path):
+    index_path = str(tmp_path / "index")
+    store = VectorStore(dim=DIM, index_path=index_path)
+    store.add(_memory("user_name", "Sarah"), _vector(1))
+    store.add(_memory("dietary_restriction", "no peanuts", "constraint"), _vector(2))
+    store.add(_memory("pet_name", "Sarah"), _vector(3))
+    store.remove_ids([2])
+    store.save_index()
+
+    for store in (store, VectorStore(dim=DIM, index_path=index_path)):
+        assert [r["id"] for r in store.lexical_search("Sarah")] == [0]
+        assert [r["id"] for r in store.lexical_search("peanuts", memory_type="fact")] == []
+        assert store.lexical_search("peanuts", memory_type="constraint")[0]["coverage"] == 1.0
+
+
+def test_reranker_orders_candidates_by_blended_score(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    query = np.zeros(DIM, dtype="float32")
+    stale = dict(_memory("old_city", "Paris"), confidence=0.5, created_at=0.0)
+    fresh = dict(_memory("city", "Tokyo", "constraint"), confidence=0.9, created_at=1e9)
+    store.add(stale, [0.1] * DIM)
+    store.add(fresh, [0.12] * DIM)
+
+    assert [r["id"] for r in store.search(query, top_k=2)] == [0, 1]
+
+    reranker = Reranker(confidence_weight=0.5, recency_weight=0.0, type_boosts={"constraint": 0.1})
+    results = store.search(query, top_k=1, reranker=reranker)
+    assert [r["id"] for r in results] == [1]
+    assert results[0]["memory"]["created_at"] == 1e9
+    assert results[0]["rank_score"] == pytest.approx(results[0]["score"] + 0.5 * 0.9 + 0.1)
+
+
+def test_near_duplicates_within_type(tmp_path):
+    store = VectorStore(dim=DIM, index_path=str(tmp_path / "index"))
+    store.add(_memory("dietary_restriction", "no peanuts", "constraint"), [1.0] + [0.0] * (DIM - 1))
+    store.add(_memory("user_name", "Sarah"), [0.0, 1.0] + [0.0] * (DIM - 2))
+
+    paraphrase = [0.98, 0.2] + [0.0] * (DIM - 2)
+    assert store.near_duplicates([paraphrase, paraphrase], ["constraint", "fact"], 0.9) == [0, None]
+    assert store.near_duplicates([paraphrase], ["constraint"], 0.999) == [None]
+
+
+def test_add_batch_matches_single_adds(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "DELTA_MERGE_ROWS", 4)
+    index_path = str(tmp_path / "batch")
+    batch = VectorStore(dim=DIM, index_path=index_path)
+    single = VectorStore(dim=DIM, index_path=str(tmp_path / "single"))
+    memories = [_memory(f"key_{i}", str(i)) for i in range(6)]
+    vectors = np.array([_vector(i) for i in range(6)])
+
+    assert batch.add_batch(memories, vectors) == list(range(6))
+    assert batch.add_batch([], np.empty((0, DIM))) == []
+    for memory, vector in zip(memories, vectors):
+        single.add(memory, vector)
+
+    # Merged once for the whole batch
+    assert batch.version.index.ntotal == 6
+    expected = [r["id"] for r in single.search(_vector(3), top_k=3)]
+    assert [r["id"] for r in batch.search(_vector(3), top_k=3)] == expected
+
+    batch.commit()
+    reloaded = VectorStore(dim=DIM, index_path=index_path)
+    assert [r["id"] for r in reloaded.search(_vector(3), top_k=3)] == expected
+
+
+def test_write_version_changes_with_visible_writes(tmp_path):
+    index_path = str(tmp_path / "index")
+    writer = VectorStore(dim=DIM, index_path=index_path)
+    initial = writer.write_version
+
+    writer.add(_memory("user_name", "Sarah"), _vector(1))
+    added = writer.write_version
+    assert added != initial
+    writer.search(_vector(1), top_k=1)
+    assert writer.write_version == added
+
+    writer.remove_ids([0])
+    assert writer.write_version != added
+
+    writer.add(_memory("location", "Tokyo"), _vector(2))
+    writer.commit()
+    reader = VectorStore(dim=DIM, index_path=index_path, read_only=True)
+    seen = reader.write_version
+    reader.refresh()
+    assert reader.write_version == seen
+    writer.add(_memory("pet", "cat"), _vector(3))
+    writer.commit()
+    reader.refresh()
+    assert reader.write_version != seen